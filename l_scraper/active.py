@@ -1,17 +1,17 @@
+import asyncio
 import json
 import os
-import random
 import re
 import threading
 from datetime import date
 from queue import Queue
 
-import pandas as pd
 import requests
 from bs4 import BeautifulSoup
-from utils import ProxyHandler, Logger
+from utils import (AsyncFetcher, ColumnStore, Progress, ProxyHandler, 
+                   ProxyPool, Logger, RateLimiter, RetryPolicy, SessionHandler)
 
-BASE_URL = "https://liquipedia.net"
+ACTIVE_PLAYERS_COLUMNS = ["Organization", "ID", "player_url"]
 
 HEADERS = {
     "Accept": "application/json, text/javascript, */*; q=0.01",
@@ -33,15 +33,37 @@ class APScraper:
         settings_file.close()
 
         self.thread_num = settings["thread_num"]
+        self.proxy_check_concurrency = settings["proxy_check_concurrency"]
+        self.proxies_path = settings["proxies_file_path"]
+        self.proxy_ttl = settings["proxy_ttl"]
+        self.base_url = settings["base_url"]
+        self.proxy_list_url = settings["proxy_list_url"]
+        self.proxy_ports = settings["proxy_ports"]
+        rate_limits = settings["rate_limits"]
+        retry = settings["retry"]
+        self.crawl_mode = settings["crawl_mode"]
+        self.max_concurrency = settings["max_concurrency"]
         _output_dir = settings["output_file_path"]
         self.output_path = f"{_output_dir}/active_players_{date.today()}.xlsx"
 
         if not os.path.exists(_output_dir):
             os.makedirs(_output_dir)
 
-        self.active_players, self.crawled = [], []
+        self.active_players = ColumnStore(ACTIVE_PLAYERS_COLUMNS)
+        self.progress = Progress()
         self.queue  = Queue()
 
+        self.proxies = ProxyPool()
+        self.rate_limiter = RateLimiter(
+            rate_limits["host"], rate_limits["global"], rate_limits["pages"],
+            rate_limits["images"], rate_limits["api"], rate_limits["parse"])
+        self.session_handler = SessionHandler(
+            self.thread_num, proxy_pool=self.proxies, 
+            rate_limiter=self.rate_limiter)
+        self.retry_policy = RetryPolicy(
+            retry["max_attempts"], retry["base_delay"], retry["max_delay"],
+            retry["deadline"], settings["dead_letter_file_path"])
+
         self.logger = Logger("APScraper")
         self.logger.info("==== Active Players Scraper Started ====")
 
@@ -61,7 +83,7 @@ class APScraper:
 
             row_dict["ID"] = row_data.get_text(strip=True)
 
-            row_dict["player_url"] = BASE_URL + row_data.a["href"]
+            row_dict["player_url"] = self.base_url + row_data.a["href"]
 
             self.active_players.append(row_dict)
 
@@ -69,17 +91,23 @@ class APScraper:
         """
         Finds the current top 20 organizations from liquipedia
         """
-        url = "https://liquipedia.net/valorant/Portal:Statistics"
+        url = f"{self.base_url}/valorant/Portal:Statistics"
+        response = None
 
-        while True:
+        for _ in self.retry_policy.attempts():
             try:
-                response = requests.get(url, headers=HEADERS)
+                response = self.session_handler.get(url, headers=HEADERS)
 
                 if response.status_code == 200:
                     break
 
             except:pass
 
+        if response is None or response.status_code != 200:
+            self.retry_policy.dead_letter(
+                "statistics", url, "could not fetch statistics portal")
+            self.logger.error("Could not fetch the top organizations")
+
         soup = BeautifulSoup(response.text, "html.parser")
 
         for table in soup.select("div.divTable"):
@@ -113,7 +141,8 @@ class APScraper:
                 if row_cell.text.strip():
 
                     if row_cell.find("span"):
-                        row_dict["active_url"] = BASE_URL + row_cell.a["href"]
+                        row_dict["active_url"] = (
+                            self.base_url + row_cell.a["href"])
 
                     row_data.append(row_cell.get_text(strip=True))
 
@@ -132,21 +161,48 @@ class APScraper:
         :param name: the name of the given organization
         """
         
-        while True:
-            proxy = {"https": f"http://{random.choice(self.proxies)}"}
+        for _ in self.retry_policy.attempts():
+            proxy = self.proxies.choose()
 
             try:
-                response = requests.get(url, verify=False, 
-                                        proxies=proxy, timeout=15)
+                response = self.session_handler.get(url, proxy, verify=False,
+                                                    timeout=15)
 
-                soup = BeautifulSoup(response.text, "html.parser")
-                tables = soup.select("table")
-
-                if response.status_code == 200 and len(tables):
-                    break
+                if (response.status_code == 200 
+                    and self.extract_active_page(response.text, name)):
+                    return
 
             except:pass
 
+        self.retry_policy.dead_letter(
+            "organization", url, "could not fetch active players")
+
+    def extract_active_page(self, content:str, name:str) -> bool:
+        """
+        Parses an organization page and extracts its active players
+
+        :param content: the html of the organization page
+        :param name: the name of the given organization
+
+        :return: False if the page has no tables
+        """
+        soup = BeautifulSoup(content, "html.parser")
+        tables = soup.select("table")
+
+        if len(tables):
+            self.extract_active_tables(tables, name)
+
+        soup.decompose()
+
+        return bool(tables)
+
+    def extract_active_tables(self, tables:list, name:str) -> None:
+        """
+        Finds the active squad tables and extracts the players in them
+
+        :param tables: the tables found on the organization page
+        :param name: the name of the given organization
+        """
         self.logger.info(f"Tables found >>> {name}: {len(tables)}")
 
         for table in tables:
@@ -156,6 +212,74 @@ class APScraper:
 
                 self.extract_active_players_rows(active_table, name)
 
+    async def fetch_active_players_async(self, fetcher:AsyncFetcher, 
+                                         url:str, name:str) -> None:
+        """
+        Fetches the active players page of an organization on the event loop
+
+        :param fetcher: the async fetcher shared by all tasks
+        :param url: the url to given organization on liquipedia
+        :param name: the name of the given organization
+        """
+        async for _ in self.retry_policy.attempts_async():
+            proxy = await self.proxies.choose_async()
+
+            try:
+                status, _, content = await fetcher.get(
+                    url, proxy, timeout=15, ssl=False)
+
+                loop = asyncio.get_running_loop()
+
+                # parsed off the event loop so the other fetches keep going
+                if status == 200 and await loop.run_in_executor(
+                    None, self.extract_active_page, content, name):
+                    return
+
+            except:pass
+
+        self.retry_policy.dead_letter(
+            "organization", url, "could not fetch active players")
+
+    async def work_async(self, fetcher:AsyncFetcher, link:str, 
+                         name:str) -> None:
+        """
+        Scrapes the active players of an organization on the event loop
+
+        :param fetcher: the async fetcher shared by all tasks
+        :param link: the url to given organization on liquipedia
+        :param name: the name of the given organization
+        """
+        await self.fetch_active_players_async(fetcher, link, name)
+
+        self.finish_link(link)
+
+    def finish_link(self, link:str) -> None:
+        """
+        Marks an organization link as crawled and logs the progress
+
+        :param link: the url to given organization on liquipedia
+        """
+        self.progress.finish(link)
+
+        self.logger.progress(
+            f"Queue: {self.progress.remaining} || Crawled: {len(self.progress)}"
+        )
+
+    async def crawl_async(self, links:list, names:list) -> None:
+        """
+        Crawls all the organizations from one event loop
+
+        :param links: a list of organization links
+        :param names: a list of top 20 organizations
+        """
+        async with AsyncFetcher(
+            self.max_concurrency, proxy_pool=self.proxies, 
+            rate_limiter=self.rate_limiter) as fetcher:
+            await asyncio.gather(*[
+                self.work_async(fetcher, link, name)
+                for link, name in zip(links, names)
+            ])
+
     def create_thread_jobs(self, links: list, names: list) -> None:
         """
         Create scraping jobs for threads
@@ -163,22 +287,17 @@ class APScraper:
         :param links: a list of links to be put on the queue
         :param names: a list of top 20 organizations to be put on the queue
         """
-        [self.queue.put((link, name, links)) for link, name in zip(links, names)]
+        [self.queue.put((link, name)) for link, name in zip(links, names)]
         self.queue.join()
 
     def work(self) -> None:
         """calls the active players fetching function with threads"""
 
         while True:
-            link, name, links = self.queue.get()
+            link, name = self.queue.get()
             self.fetch_active_players(link, name)
 
-            links.remove(link)
-            self.crawled.append(link)
-
-            self.logger.info(
-                f"Queue: {len(links)} || Crawled: {len(self.crawled)}"
-            )
+            self.finish_link(link)
 
             self.queue.task_done()
 
@@ -186,33 +305,43 @@ class APScraper:
         """Saves data to excel"""
         self.logger.info("Finished scraping. Saving to excel...")
 
-        df = pd.DataFrame.from_dict(self.active_players)
-        active_players = df[["Organization", "ID", "player_url"]]
+        active_players = self.active_players.to_dataframe(
+            ACTIVE_PLAYERS_COLUMNS)
         active_players.to_excel(self.output_path, index=False)
 
         self.logger.info("Records saved!")
 
     def run(self) -> None:
         """Entry point to the scraper"""
-        urls, names = [], []
+        organizations = {}
 
-        proxy_handler = ProxyHandler()
+        proxy_handler = ProxyHandler(self.session_handler, self.proxies,
+                                     self.proxy_check_concurrency,
+                                     self.proxies_path, self.proxy_ttl,
+                                     self.base_url, self.proxy_list_url,
+                                     self.proxy_ports)
         proxy_handler.get_proxies()
-        
-        self.proxies = proxy_handler.proxies
 
         for organization in self.find_top_twenty():
-            names.append(organization["Organization"])
+            organizations.setdefault(
+                organization["active_url"], organization["Organization"])
 
-            urls.append(organization["active_url"])
+        urls, names = list(organizations), list(organizations.values())
+        self.progress.total = len(urls)
 
-        [threading.Thread(target=self.work, daemon=True).start()
-         for _ in range(self.thread_num)]
+        if self.crawl_mode == "async":
+            asyncio.run(self.crawl_async(urls, names))
+        else:
+            [threading.Thread(target=self.work, daemon=True).start()
+             for _ in range(self.thread_num)]
 
-        self.create_thread_jobs(urls, names)
+            self.create_thread_jobs(urls, names)
 
         self.append_to_excel()
 
+        proxy_handler.close()
+        self.session_handler.close()
+
 
 if __name__ == "__main__":
     scraper = APScraper()
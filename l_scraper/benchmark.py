@@ -0,0 +1,236 @@
+import argparse
+import glob
+import json
+import os
+import time
+import tracemalloc
+from datetime import datetime
+
+from bs4 import BeautifulSoup
+
+from active import ACTIVE_PLAYERS_COLUMNS, APScraper
+from main import ProfileExtractor
+from utils import ColumnStore, Logger
+
+FIXTURES_DIR = "./benchmarks/fixtures"
+RESULTS_DIR = "./benchmarks/results"
+
+
+class Benchmark:
+    def __init__(self, repeat:int, fast_parser:bool) -> None:
+        """
+        Measures the extractors offline over the saved pages in the fixture
+        corpus. Every page is parsed once up front so that the extractors are
+        timed on their own; parsing is timed as a separate benchmark
+
+        :param repeat: how many times every page goes through each extractor
+        :param fast_parser: whether the player pages are parsed with the fast
+        parser, like the scraper does with the same setting
+        """
+        self.repeat = repeat
+        self.fast_parser = fast_parser
+
+        self.extractor = ProfileExtractor(fast_parser)
+        self.ap_scraper = APScraper()
+
+        self.results = {}
+
+        self.logger = Logger("Benchmark")
+
+    @staticmethod
+    def load_fixtures(kind:str) -> list:
+        """
+        Reads the saved pages of a given kind from the fixture corpus
+
+        :param kind: "players", "organizations" or "statistics"
+        """
+        pages = []
+
+        for path in sorted(glob.glob(f"{FIXTURES_DIR}/{kind}/*.html")):
+            with open(path, "rb") as file:
+                pages.append(file.read())
+
+        return pages
+
+    def measure(self, name:str, inputs:list, function) -> None:
+        """
+        Runs a function over every input and records pages per second and the
+        peak memory allocated by a single pass
+
+        :param name: the name the result is saved under
+        :param inputs: the arguments of one call per page
+        :param function: the function to benchmark
+        """
+        if not inputs:
+            self.logger.warn(f"No fixtures for {name}. Skipped")
+            return
+
+        tracemalloc.start()
+
+        for args in inputs:
+            function(*args)
+
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        started = time.perf_counter()
+
+        for _ in range(self.repeat):
+            for args in inputs:
+                function(*args)
+
+        elapsed = time.perf_counter() - started
+        pages = self.repeat * len(inputs)
+
+        self.results[name] = {
+            "pages": pages,
+            "seconds": round(elapsed, 4),
+            "pages_per_second": round(pages / elapsed, 2),
+            "peak_memory_kb": round(peak / 1024, 1)
+        }
+
+        self.logger.info(f"{name}: {pages / elapsed:.1f} pages/s | "
+                         f"peak {peak / 1024:.0f} KB")
+
+    def bench_players(self) -> None:
+        """Benchmarks parsing and every extractor of the player pages"""
+        pages = self.load_fixtures("players")
+        soups = [self.extractor.parse_page(page) for page in pages]
+
+        names = [self.extractor.extract_bio(soup, {}) for soup in soups]
+        tables = []
+
+        for soup, name in zip(soups, names):
+            w_tables = []
+            self.extractor.sort_tables(soup, w_tables, name, [], [])
+            tables.append(w_tables)
+
+        achievement_tables = [
+            table for soup in soups for table in soup.select("table")
+            if "wikitable-striped" in table.attrs.get("class", [])]
+
+        self.measure("parse_page", [(page,) for page in pages],
+                     self.extractor.parse_page)
+        self.measure("extract_bio", [(soup, {}) for soup in soups],
+                     self.extractor.extract_bio)
+        self.measure("extract_external_links",
+                     [(soup, {}) for soup in soups],
+                     self.extractor.extract_external_links)
+        self.measure("sort_tables",
+                     [(soup, [], name, [], [])
+                      for soup, name in zip(soups, names)],
+                     self.extractor.sort_tables)
+        self.measure("extract_settings",
+                     [(w_tables, {}) for w_tables in tables],
+                     self.extractor.extract_settings)
+        self.measure("extract_achievements",
+                     [(table, "player", []) for table in achievement_tables],
+                     self.extractor.extract_achievements)
+        self.measure("extract_profile",
+                     [(page, "https://liquipedia.net/valorant/Player")
+                      for page in pages],
+                     self.extractor.extract_profile)
+
+    def bench_organizations(self) -> None:
+        """Benchmarks the extractors of the active players scraper"""
+        statistics = [
+            BeautifulSoup(page, "html.parser")
+            for page in self.load_fixtures("statistics")]
+        organization_tables = [
+            table for soup in statistics for table in soup.select("div.divTable")
+            if "organization" in str(table).lower()]
+
+        squads = []
+
+        for page in self.load_fixtures("organizations"):
+            soup = BeautifulSoup(page, "html.parser")
+
+            squads.extend(table for table in soup.select("table")
+                          if "active squad" in str(table).lower())
+
+        self.measure("extract_top_organizations",
+                     [(table,) for table in organization_tables],
+                     self.ap_scraper.extract_top_organizations)
+        self.measure("extract_active_players_rows",
+                     [(table, "organization") for table in squads],
+                     self.ap_scraper.extract_active_players_rows)
+
+        self.ap_scraper.active_players = ColumnStore(ACTIVE_PLAYERS_COLUMNS)
+
+    def run(self) -> dict:
+        """Runs all the benchmarks and returns the results"""
+        self.bench_players()
+        self.bench_organizations()
+
+        return {
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "repeat": self.repeat,
+            "fast_parser": self.fast_parser,
+            "results": self.results
+        }
+
+    def compare(self, report:dict, baseline_path:str) -> None:
+        """
+        Logs the change in pages per second and peak memory against a saved
+        baseline
+
+        :param report: the results of this run
+        :param baseline_path: a json file saved by an earlier run
+        """
+        with open(baseline_path, "r") as file:
+            baseline = json.load(file)["results"]
+
+        for name, result in report["results"].items():
+            previous = baseline.get(name)
+
+            if previous is None:
+                continue
+
+            speed = (result["pages_per_second"]
+                     / previous["pages_per_second"] - 1) * 100
+            memory = (result["peak_memory_kb"]
+                      / max(previous["peak_memory_kb"], 0.1) - 1) * 100
+
+            self.logger.info(f"{name}: {speed:+.1f}% pages/s | "
+                             f"{memory:+.1f}% peak memory")
+
+    @staticmethod
+    def save(report:dict, path:str) -> None:
+        """
+        Saves the results as json
+
+        :param report: the results of this run
+        :param path: the json file to write
+        """
+        directory = os.path.dirname(path)
+
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        with open(path, "w") as file:
+            json.dump(report, file, indent=4)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Offline benchmark of the extractors")
+    parser.add_argument("--repeat", type=int, default=20,
+                        help="passes over the fixture corpus per benchmark")
+    parser.add_argument("--slow-parser", action="store_true",
+                        help="parse player pages with html.parser")
+    parser.add_argument("--baseline",
+                        help="a results file to compare this run against")
+    parser.add_argument("--output",
+                        default=f"{RESULTS_DIR}/benchmark_"
+                                f"{datetime.now():%Y-%m-%d_%H%M%S}.json",
+                        help="where the results are saved")
+    args = parser.parse_args()
+
+    benchmark = Benchmark(args.repeat, not args.slow_parser)
+    report = benchmark.run()
+
+    benchmark.save(report, args.output)
+    benchmark.logger.info(f"Results saved >> {args.output}")
+
+    if args.baseline:
+        benchmark.compare(report, args.baseline)
@@ -1,14 +1,27 @@
+import argparse
+import asyncio
 import json
 import os
-import random
 import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
 from datetime import date
+from functools import lru_cache
+from multiprocessing import get_context
 from queue import Queue
+from urllib.parse import urlsplit, urlunsplit
 
 import pandas as pd
 import requests
-from bs4 import BeautifulSoup
-from utils import CSVHandler, ImageHandler, Logger, ProxyHandler
+from bs4 import BeautifulSoup, SoupStrainer
+from utils import (ApiHandler, AsyncFetcher, CacheHandler, CSVHandler,
+                   Frontier, ImageHandler, ImageJob, ImageManifest, JournalHandler,
+                   Logger, Metrics, Progress, ProxyHandler, ProxyPool,
+                   RateLimiter, RecordStream, RetryPolicy, RevisionHandler,
+                   SessionHandler)
+
+# statuses of pages that are gone, retrying them cannot help
+GONE_STATUSES = (404, 410)
 
 IGNORE_HEADING_LIST = [
     "mouse settings", "hardware", "crosshair settings", "last updated"
@@ -27,32 +40,47 @@ COLUMN_HEADERS = [
     "tiktok", "reddit",	"bilibili",	"vk",	"Pointer Speed",
     "Outer Lines",	"esl",	"5ewin"]
 
-class LiquipediaScraper:
-    requests.packages.urllib3.disable_warnings()
 
-    def __init__(self) -> None:
-        settings_file = open("./settings/settings.json", "r")
-        settings = json.load(settings_file)
-        settings_file.close()
+def is_profile_section(name:str, attrs:dict) -> bool:
+    """
+    Tells whether a tag is part of the sections the extractors read: the page
+    heading, the infobox (bio, links and image) and the tables
 
-        self.thread_num = settings["thread_num"]
-        self._input_file_path = settings["input_file_path"]
-        _output_dir = settings["output_file_path"]
-        self.output_path = f"{_output_dir}/scraped_data_{date.today()}.xlsx"
-        self.images_path = settings["image_dir"]
+    :param name: the tag name
+    :param attrs: the tag attributes
+    """
+    if name == "table":
+        return True
 
-        if not os.path.exists(_output_dir):
-            os.makedirs(_output_dir)
+    if name == "h1":
+        return attrs.get("id") == "firstHeading"
 
-        self.profiles, self.history, self.achievements = [], [], []
-        self.queue, self.images_queue = Queue(), Queue()
-        self.images, self.crawled = [], []
+    return name == "div" and "infobox" in str(attrs.get("class", ""))
 
-        self.logger = Logger(__class__.__name__)
 
-        self.logger.info("==== Liquipedia scraper started ====")
+PROFILE_STRAINER = SoupStrainer(is_profile_section)
+
+
+class ProfileExtractor:
+    """
+    Extracts the records of a player profile page. Holds no crawl state so
+    that it can also run in the parse worker processes
+    """
 
-    def sort_tables(self, soup:BeautifulSoup, w_tables:list, name:str) -> None:
+    def __init__(self, fast_parser:bool, image_width:int=0) -> None:
+        """
+        :param fast_parser: whether to parse with lxml and only build the
+        sections the extractors read
+        :param image_width: the width of the player images to download. 0
+        takes the image shown on the page
+        """
+        self.fast_parser = fast_parser
+        self.image_width = image_width
+
+        self.logger = Logger(self.__class__.__name__)
+
+    def sort_tables(self, soup:BeautifulSoup, w_tables:list, name:str,
+                    history:list, achievements:list) -> None:
         """
         sorts the tables into history, achievements and settings.
 
@@ -60,22 +88,27 @@ class LiquipediaScraper:
         :param w_tables: empty list to which tables of class "wikitable" are 
         appended
         :param name: the name of the player
+        :param history: list to which the player's history rows are appended
+        :param achievements: list to which the player's achievements are 
+        appended
         """
-        for table in soup.select("table"):
+        tables = soup.select("table")
+
+        for table in tables:
             try:
                 _class = table.attrs["class"]
 
                 if len(_class) == 1 and _class[0] == "wikitable":
                     w_tables.append(table)
                 elif "wikitable-striped" in _class:
-                    self.extract_achievements(table, name)
+                    self.extract_achievements(table, name, achievements)
                 
             except:
                 pass
         
         try:
-            history_rows = soup.select("table")[0].select("tr")
-            self.extract_history(history_rows, name)
+            history_rows = tables[0].select("tr")
+            self.extract_history(history_rows, name, history)
 
         except:
             self.logger.info(f"History table for {name} not found!!!")
@@ -112,7 +145,7 @@ class LiquipediaScraper:
         for (key, value) in (zip(keys, values)):
             data_dict[key] = value
         
-        self.logger.info(f"Extracting player slugs for >>> {name}")
+        self.logger.progress(f"Extracting player slugs for >>> {name}")
 
         return name
 
@@ -133,12 +166,14 @@ class LiquipediaScraper:
 
         except:pass
 
-    def extract_history(self, history_rows:BeautifulSoup, name:str) -> None:
+    def extract_history(self, history_rows:BeautifulSoup, name:str,
+                        history_list:list) -> None:
         """
         Extracts player's history from the history table
 
         :param history_rows: table rows from the history table
         :param name: player's name
+        :param history_list: list to which the history rows are appended
         """
         
         for row in history_rows:
@@ -148,7 +183,7 @@ class LiquipediaScraper:
             history = {
                 "ID": name, "From":_from, "To": _to, "Team": team
             }
-            self.history.append(history)
+            history_list.append(history)
     
     def extract_settings(self, s_tables:BeautifulSoup, data_dict:dict) -> None:
         """
@@ -183,14 +218,14 @@ class LiquipediaScraper:
             for (key, value) in (zip(headings, values)):
                 data_dict[key] = value
 
-        self.profiles.append(data_dict) 
-
-    def extract_achievements(self, table:BeautifulSoup, name:str) -> None:
+    def extract_achievements(self, table:BeautifulSoup, name:str,
+                             achievements:list) -> None:
         """
         Extracts player  achievement slugs from the achievements table
         
         :param table: a beautifulsoup object containing the achivements slugs
         :param name: players name
+        :param achievements: list to which the achievement rows are appended
         """
         headings, rows = [], []
 
@@ -223,100 +258,758 @@ class LiquipediaScraper:
                 row_dict[heading] = value
 
             if len(row_dict):
-                self.achievements.append(row_dict)
+                achievements.append(row_dict)
+
+    def parse_page(self, content:bytes) -> BeautifulSoup:
+        """
+        Parses a profile page. The fast parser parses the raw bytes with lxml
+        and only builds the heading, the infobox and the tables
+
+        :param content: the html of the profile page
+        """
+        if self.fast_parser:
+            return BeautifulSoup(content, "lxml", parse_only=PROFILE_STRAINER)
+
+        return BeautifulSoup(content, "html.parser")
+
+    def extract_profile(self, content:bytes, link:str) -> dict:
+        """
+        Parses a profile page and extracts all of its records
+
+        :param content: the html of the profile page
+        :param link: the link to the player's profile on Liquipedia
+
+        :return: a dictionary of the player's name, profile, history rows, 
+        achievement rows, image url and the seconds spent parsing and 
+        extracting, or None if the bio was not found. The records are plain
+        strings, so the parsed tree is freed before this returns
+        """
+        started = time.perf_counter()
+        soup = self.parse_page(content)
+        parsed = time.perf_counter()
+        data_dict, wikitables, history, achievements = {}, [], [], []
+
+        try:
+            name = self.extract_bio(soup, data_dict)
+
+            if not name:
+                return None
+
+            data_dict["Profile URL"] = link
+
+            self.extract_external_links(soup, data_dict)
+            self.sort_tables(soup, wikitables, name, history, achievements)
+            self.extract_settings(wikitables, data_dict)
+
+            image_url, image_fallback = ImageHandler.find_image_url(
+                soup, self.image_width)
+
+        finally:
+            # the tree is full of reference cycles; without this it lives
+            # until the garbage collector gets to it
+            soup.decompose()
+
+        return {
+            "name": name, "profile": data_dict, "history": history,
+            "achievements": achievements, "image_url": image_url,
+            "image_fallback": image_fallback,
+            "timings": {"parse": parsed - started, 
+                        "extract": time.perf_counter() - parsed}
+        }
+
+
+@lru_cache(maxsize=None)
+def get_extractor(fast_parser:bool, image_width:int) -> ProfileExtractor:
+    """
+    Returns the extractor of the current process
+
+    :param fast_parser: whether to use the fast parser
+    :param image_width: the width of the player images to download
+    """
+    return ProfileExtractor(fast_parser, image_width)
+
+
+def extract_in_process(content:bytes, link:str, fast_parser:bool,
+                       image_width:int) -> dict:
+    """
+    Extracts the records of a profile page in a parse worker process
+
+    :param content: the html of the profile page
+    :param link: the link to the player's profile on Liquipedia
+    :param fast_parser: whether to use the fast parser
+    :param image_width: the width of the player images to download
+    """
+    return get_extractor(fast_parser, image_width).extract_profile(
+        content, link)
+
+
+class LiquipediaScraper(ProfileExtractor):
+    requests.packages.urllib3.disable_warnings()
+
+    def __init__(self, resume:bool=False, dead_letters:bool=False) -> None:
+        """
+        :param resume: whether to resume the crawl journaled by the last run
+        :param dead_letters: whether to only crawl the pages given up by
+        earlier runs. Such a pass writes to its own output files and journal
+        so that the outputs of the main run are kept
+        """
+        self.dead_letters = dead_letters
+
+        settings_file = open("./settings/settings.json", "r")
+        settings = json.load(settings_file)
+        settings_file.close()
+
+        self.thread_num = settings["thread_num"]
+        self.proxy_check_concurrency = settings["proxy_check_concurrency"]
+        self.proxies_path = settings["proxies_file_path"]
+        self.proxy_ttl = settings["proxy_ttl"]
+        self.base_url = settings["base_url"]
+        self.proxy_list_url = settings["proxy_list_url"]
+        self.proxy_ports = settings["proxy_ports"]
+        rate_limits = settings["rate_limits"]
+        retry = settings["retry"]
+        self._input_file_path = settings["input_file_path"]
+        discovery = settings["discovery"]
+        self.listing_urls = [
+            self.rebase_link(url) for url in discovery["listing_urls"]]
+        self.discovery_workers = discovery["workers"]
+        _output_dir = settings["output_file_path"]
+        _run_name = (f"dead_letters_{date.today()}" if dead_letters 
+                     else f"{date.today()}")
+        self.output_path = f"{_output_dir}/scraped_data_{_run_name}.xlsx"
+        self.images_path = settings["image_dir"]
+        image_processing = settings["image_processing"]
+        self.image_workers = image_processing["workers"]
+        self.image_max_width = image_processing["max_width"]
+        self.image_format = image_processing["format"]
+        self.crawl_mode = settings["crawl_mode"]
+        self.fetch_mode = settings["fetch_mode"]
+        self.parse_workers = settings["parse_workers"]
+        self.max_concurrency = settings["max_concurrency"]
+        self.cache_dir = settings["cache_dir"]
+        self.incremental = settings["incremental"]
+        self.revisions_path = settings["revisions_file_path"]
+        self.excel_output = settings["excel_output"]
+        output_format = settings["output_format"]
+        metrics = settings["metrics"]
+        self.metrics_port = metrics["port"]
+        self.metrics_path = metrics["dump_file_path"]
+        self.metrics_interval = metrics["dump_interval"]
+
+        if not os.path.exists(_output_dir):
+            os.makedirs(_output_dir)
+
+        self.profiles, self.history, self.achievements = [
+            RecordStream(f"{_output_dir}/{kind}_{_run_name}.{output_format}",
+                         output_format, settings["batch_size"])
+            for kind in ("profiles", "history", "achievements")
+        ]
+        self.streams = {"profiles": self.profiles, "history": self.history,
+                        "achievements": self.achievements}
+        self.queue, self.images_queue = Queue(), Queue()
+        self.progress = Progress()
+        self.seen_links = set()
+        self.saved_links = set()
+        self.links_lock = threading.Lock()
+
+        self.proxies = ProxyPool()
+        self.rate_limiter = RateLimiter(
+            rate_limits["host"], rate_limits["global"], rate_limits["pages"],
+            rate_limits["images"], rate_limits["api"], rate_limits["parse"])
+        self.metrics = Metrics()
+        self.session_handler = SessionHandler(
+            self.thread_num, proxy_pool=self.proxies, 
+            rate_limiter=self.rate_limiter, metrics=self.metrics)
+        self.retry_policy = RetryPolicy(
+            retry["max_attempts"], retry["base_delay"], retry["max_delay"],
+            retry["deadline"], settings["dead_letter_file_path"], 
+            self.metrics)
+        self.cache_handler = CacheHandler(self.cache_dir)
+        self.image_manifest = ImageManifest(
+            settings["image_manifest_file_path"], 
+            settings["image_refresh_interval"])
+        self.journal_handler = JournalHandler(
+            self.journal_path(settings["journal_file_path"]), resume)
+        self.revision_handler = None
+        self.parse_pool = None
+
+        super().__init__(settings["fast_parser"], settings["image_width"])
+
+        self.logger.info("==== Liquipedia scraper started ====")
+
+    def journal_path(self, path:str) -> str:
+        """
+        Returns the journal of this run, a separate one for a dead-letter pass
+
+        :param path: the journal of the main runs
+        """
+        if not self.dead_letters:
+            return path
 
-    def request_page(self, link:str) -> BeautifulSoup:
+        root, extension = os.path.splitext(path)
+
+        return f"{root}_dead_letters{extension}"
+
+    def page_url(self, link:str) -> str:
+        """
+        Returns the url to request for a profile depending on the fetch mode
+
+        :param link: the link to the player's profile on Liquipedia
+        """
+        if self.fetch_mode == "api":
+            return ApiHandler.parse_url(link)
+
+        return link
+
+    def page_html(self, content:bytes) -> bytes:
+        """
+        Returns the html to parse from a response body depending on the fetch
+        mode
+
+        :param content: the body of the response
+        """
+        if content and self.fetch_mode == "api":
+            return ApiHandler.to_html(content)
+
+        return content
+
+    def fetch_page(self, link:str) -> bytes:
         """
         Fetches a player profile from a given url
         
         :param link: the link to the player's profile on Liquipedia
+
+        :return: the html of the page or None once the retries run out
         """
-        while True:
+        url = self.page_url(link)
+        reason = "could not fetch page"
+
+        for _ in self.retry_policy.attempts():
             try:
-                proxy = {"https":f"http://{random.choice(self.proxies)}"}
-                response = requests.get(link, proxies=proxy, timeout=10)
+                proxy = self.proxies.choose()
+                headers = self.cache_handler.conditional_headers(url)
+
+                started = time.monotonic()
+                response = self.session_handler.get(
+                    url, proxy, timeout=10, headers=headers)
+                self.metrics.observe("stage_seconds", 
+                                     time.monotonic() - started, stage="fetch")
 
-                if response.status_code == 200:
-                    soup = BeautifulSoup(response.text, "html.parser")
-                else:continue
+                if response.status_code in GONE_STATUSES:
+                    reason = f"page not found ({response.status_code})"
+                    break
 
-                return soup
+                content = self.page_html(self.cache_handler.resolve(
+                    url, response.status_code, response.headers, 
+                    response.content))
+
+                if content:
+                    return content
 
             except:pass  
 
-    def extract_slugs(self, link:str, data_dict:dict) -> tuple:
-        """Calls the functions to extract profiles, history and achivements"""
-        wikitables, name =  [], ""
+        self.retry_policy.dead_letter("page", link, reason)
 
-        while not name:
-            soup = self.request_page(link)
-            name = self.extract_bio(soup, data_dict)
+    def save_records(self, link:str, record:dict) -> None:
+        """
+        Adds the records of a finished page to the output and the journal
 
-        data_dict["Profile URL"] = link
+        :param link: the link to the player's profile on Liquipedia
+        :param record: the records extracted from the page
+        """
+        self.write_records(link, record)
 
-        self.extract_external_links(soup, data_dict)
-        self.sort_tables(soup, wikitables, name)
-        self.extract_settings(wikitables, data_dict)
+        self.journal_handler.record(link, record["profile"], 
+                                    record["history"], record["achievements"])
 
-        return soup, name
+        self.metrics.inc("pages_total")
 
+        for stage, seconds in record["timings"].items():
+            self.metrics.observe("stage_seconds", seconds, stage=stage)
+
+    def write_records(self, link:str, record:dict) -> None:
+        """
+        Writes the records of a page to the output streams and tells the
+        revision handler where they are
+
+        :param link: the link to the player's profile on Liquipedia
+        :param record: the page's profile, history and achievements
+        """
+        offsets = {
+            "profiles": [self.profiles.append(record["profile"]), 1],
+            "history": [self.history.extend(record["history"]),
+                        len(record["history"])],
+            "achievements": [self.achievements.extend(record["achievements"]),
+                             len(record["achievements"])]
+        }
+
+        if self.revision_handler is not None:
+            self.revision_handler.record_offsets(link, offsets)
+
+        if self.dead_letters:
+            self.saved_links.add(link)
+
+    def extract_slugs(self, link:str) -> dict:
+        """
+        Calls the functions to extract profiles, history and achivements. The
+        page is parsed in the parse worker processes if there are any
+
+        :param link: the link to the player's profile on Liquipedia
+
+        :return: the records extracted from the page or None if the page was
+        given up
+        """
+        content = self.fetch_page(link)
+
+        if content is None:
+            return None
+
+        # the same body comes back from the cache on a retry, so a page
+        # without a bio is given up at once
+        if self.parse_pool is None:
+            record = self.extract_profile(content, link)
+        else:
+            record = self.parse_pool.submit(
+                extract_in_process, content, link, self.fast_parser,
+                self.image_width
+            ).result()
+
+        if not record:
+            self.retry_policy.dead_letter("page", link, "player bio not found")
+            return None
+
+        self.save_records(link, record)
+
+        return record
 
     def work(self) -> None:
         """Fetches a link from the queue and scrapes the player profile"""
         while True:
-            link, data_dict, profiles = self.queue.get()
-            soup, name = self.extract_slugs(link, data_dict)
+            link = self.queue.get()
+            record = self.extract_slugs(link)
 
-            self.create_image_jobs(soup, name)
+            if record and record["image_url"]:
+                self.create_image_jobs(record["name"], record["image_url"],
+                                       record["image_fallback"])
 
-            profiles.remove(link)
-            self.crawled.append(link)
-
-            self.logger.info(
-                f"Queue: {len(profiles)} | Crawled: {len(self.crawled)} | "
-                f"Downloaded images: {len(self.images)}")
+            self.finish_link(link)
 
             self.queue.task_done()
 
-    def create_image_jobs(self, soup:BeautifulSoup, name:str) -> None:
-        """Create jobs for image scraping threads"""
-        self.images_queue.put((soup, name))
-        self.images_queue.join()
+    def finish_link(self, link:str) -> None:
+        """
+        Marks a profile link as crawled and logs the progress
+
+        :param link: the link to the player's profile on Liquipedia
+        """
+        self.progress.finish(link)
+
+        self.logger.progress(
+            f"Queue: {self.progress.remaining} | "
+            f"Crawled: {len(self.progress)} | "
+            f"Downloaded images: {self.progress.count('images')}")
+
+    def create_image_jobs(self, name:str, image_url:str, 
+                          fallback_url:str=None) -> None:
+        """
+        Create jobs for image scraping threads. Does not wait for the image to
+        be downloaded; the images queue is joined once at the end of the run
+
+        :param name: the name of the player
+        :param image_url: relative path to the player's image on the server
+        :param fallback_url: relative path to the image the image url was
+        resized from, or None
+        """
+        self.images_queue.put(ImageJob(name, image_url, fallback_url))
     
-    def create_thread_jobs(self) -> None:
-        """Create scraping jobs for threads"""
+    def read_links(self) -> list:
+        """
+        Reads the profile links from the input file, or from the dead-letter
+        file in a dead-letter pass. Duplicate links are dropped. Without an
+        input file the profiles only come from discovery
+        """
+        if self.dead_letters:
+            return self.retry_policy.read_dead_letters("page")
+
+        if not self._input_file_path:
+            return []
+
         df = pd.read_excel(
             self._input_file_path, sheet_name="List of Profiles")
-        links = df["Link"].to_list()
 
-        [self.queue.put((link, dict(), links)) for link in links]
+        links = [self.rebase_link(link) for link in df["Link"].to_list()]
+        unique = list(dict.fromkeys(links))
+
+        if len(unique) < len(links):
+            self.logger.info(
+                f"Duplicate links dropped: {len(links) - len(unique)}")
+
+        return unique
+
+    def rebase_link(self, link:str) -> str:
+        """
+        Points a profile link at the configured site, e.g. a local mock
+
+        :param link: the link to the player's profile on Liquipedia
+        """
+        url = urlsplit(link)
+
+        return urlunsplit(urlsplit(self.base_url)[:2] + url[2:])
+
+    def resume_links(self, links:list) -> list:
+        """
+        Restores the records of the pages finished by the last run from the
+        journal and returns the links that still have to be crawled
+
+        :param links: the profile links to be crawled
+        """
+        remaining = []
+
+        for link in links:
+            entry = self.journal_handler.get(link)
+
+            if entry is None:
+                remaining.append(link)
+                continue
+
+            self.write_records(link, entry)
+
+        if len(remaining) < len(links):
+            self.logger.info(f"Resuming. Restored: {len(links) - len(remaining)}"
+                             f" | Remaining: {len(remaining)}")
+
+        return remaining
+
+    def add_links(self, links:list) -> list:
+        """
+        Adds profile links to the crawl, from the input file or as they are
+        discovered. Links already added are dropped, then unchanged pages are
+        carried forward and pages finished by the last run are restored
+        instead of crawled
+
+        :param links: the profile links found
+
+        :return: the links that have to be crawled
+        """
+        with self.links_lock:
+            links = [link for link in dict.fromkeys(map(self.rebase_link, links))
+                     if link not in self.seen_links]
+            self.seen_links.update(links)
+
+            if links and self.revision_handler is not None:
+                links = self.revision_handler.filter_changed(links)
+
+            links = self.resume_links(links)
+            self.progress.add(len(links))
+
+        return links
+
+    def enqueue_links(self, links:list) -> None:
+        """
+        Create scraping jobs for threads from discovered profile links
+
+        :param links: the profile links found
+        """
+        [self.queue.put(link) for link in self.add_links(links)]
+
+    def start_discovery(self, on_links) -> Frontier:
+        """
+        Starts walking the listing pages for profiles unless no listing pages
+        are set or only dead letters are crawled
+
+        :param on_links: called with the profile links of every listing page
+
+        :return: the running frontier or None
+        """
+        if self.dead_letters or not self.listing_urls:
+            return None
+
+        frontier = Frontier(self.listing_urls, self.discovery_workers,
+                            self.session_handler, self.proxies,
+                            self.retry_policy, self.metrics)
+        frontier.start(on_links)
+
+        return frontier
+
+    def create_thread_jobs(self, links:list) -> None:
+        """
+        Create scraping jobs for threads and waits for them, including the
+        ones discovered meanwhile
+
+        :param links: the profile links to be crawled
+        """
+        frontier = self.start_discovery(self.enqueue_links)
+
+        [self.queue.put(link) for link in links]
+
+        if frontier is not None:
+            frontier.join()
+
         self.queue.join()
+
+    async def fetch_page_async(self, fetcher:AsyncFetcher, link:str) -> bytes:
+        """
+        Fetches a player profile from a given url on the event loop
+        
+        :param fetcher: the async fetcher shared by all tasks
+        :param link: the link to the player's profile on Liquipedia
+
+        :return: the html of the page or None once the retries run out
+        """
+        url = self.page_url(link)
+        reason = "could not fetch page"
+
+        async for _ in self.retry_policy.attempts_async():
+            try:
+                proxy = await self.proxies.choose_async()
+
+                started = time.monotonic()
+                status, headers, content = await fetcher.get(
+                    url, proxy, timeout=10, 
+                    headers=self.cache_handler.conditional_headers(url))
+                self.metrics.observe("stage_seconds", 
+                                     time.monotonic() - started, stage="fetch")
+
+                if status in GONE_STATUSES:
+                    reason = f"page not found ({status})"
+                    break
+
+                content = self.page_html(self.cache_handler.resolve(
+                    url, status, headers, content))
+
+                if content:
+                    return content
+
+            except:pass
+
+        self.retry_policy.dead_letter("page", link, reason)
+
+    async def download_image_async(self, fetcher:AsyncFetcher, 
+                                   image_handler:ImageHandler,
+                                   name:str, image_url:str,
+                                   fallback_url:str=None) -> None:
+        """
+        Downloads the player's image on the event loop, from the fallback url
+        if the image url cannot be saved
+
+        :param fetcher: the async fetcher shared by all tasks
+        :param image_handler: the handler used to save images and reuse the
+        ones that are up to date
+        :param name: the name of the player
+        :param image_url: relative path to the player's image on the server
+        :param fallback_url: relative path to the image the image url was
+        resized from, or None
+        """
+        urls = [url for url in dict.fromkeys((image_url, fallback_url)) if url]
+
+        if any(image_handler.reuse_image(name, url) for url in urls):
+            return
+
+        for source in urls:
+            url = f"{self.base_url}{source}"
+
+            async for _ in self.retry_policy.attempts_async():
+                try:
+                    proxy = await self.proxies.choose_async()
+
+                    started = time.monotonic()
+                    status, headers, content = await fetcher.get(
+                        url, proxy, timeout=30, 
+                        headers=self.image_manifest.conditional_headers(
+                            name, source))
+                    self.metrics.observe("stage_seconds", 
+                                         time.monotonic() - started, 
+                                         stage="image")
+
+                    stored = await asyncio.get_running_loop().run_in_executor(
+                        None, image_handler.store_image, name, source, status,
+                        headers, content)
+
+                    if stored:
+                        return
+
+                except:
+                    self.logger.warn("Could not download image. Retrying...")
+
+        self.retry_policy.dead_letter("image", f"{self.base_url}{image_url}", 
+                                      "could not download image")
+
+    async def work_async(self, fetcher:AsyncFetcher, 
+                         image_handler:ImageHandler, link:str, 
+                         image_tasks:set) -> None:
+        """
+        Scrapes a player profile and schedules its image download
+
+        :param fetcher: the async fetcher shared by all tasks
+        :param image_handler: the handler used to locate and save images
+        :param link: the link to the player's profile on Liquipedia
+        :param image_tasks: a set holding the pending image tasks
+        """
+        record, content = None, await self.fetch_page_async(fetcher, link)
+
+        # parsed off the event loop so the other fetches keep going,
+        # in the default thread pool if there are no parse processes
+        if content is not None and self.parse_pool is None:
+            record = await asyncio.get_running_loop().run_in_executor(
+                None, self.extract_profile, content, link)
+        elif content is not None:
+            record = await asyncio.get_running_loop().run_in_executor(
+                self.parse_pool, extract_in_process, content, link, 
+                self.fast_parser, self.image_width)
+
+        if record:
+            self.save_records(link, record)
+
+            if record["image_url"]:
+                task = asyncio.create_task(self.download_image_async(
+                    fetcher, image_handler, record["name"], 
+                    record["image_url"], record["image_fallback"]))
+                image_tasks.add(task)
+                task.add_done_callback(image_tasks.discard)
+        elif content is not None:
+            self.retry_policy.dead_letter("page", link, "player bio not found")
+
+        self.finish_link(link)
+
+    async def crawl_async(self, image_handler:ImageHandler, 
+                          links:list) -> None:
+        """
+        Crawls all the profiles from one event loop. Discovered profiles are
+        handed over from the discovery threads to the loop
+
+        :param image_handler: the handler used to locate and save images
+        :param links: the profile links to be crawled
+        """
+        loop = asyncio.get_running_loop()
+        page_tasks, image_tasks = set(), set()
+
+        # pages and images are tasks here rather than queue items
+        self.metrics.gauge("queue_depth", lambda: len(page_tasks), 
+                           queue="pages")
+        self.metrics.gauge("queue_depth", lambda: len(image_tasks), 
+                           queue="images")
+
+        async with AsyncFetcher(
+            self.max_concurrency, proxy_pool=self.proxies, 
+            rate_limiter=self.rate_limiter, metrics=self.metrics) as fetcher:
+
+            def schedule(link:str) -> None:
+                task = asyncio.create_task(self.work_async(
+                    fetcher, image_handler, link, image_tasks))
+                page_tasks.add(task)
+                task.add_done_callback(page_tasks.discard)
+
+            frontier = self.start_discovery(lambda links: [
+                loop.call_soon_threadsafe(schedule, link) 
+                for link in self.add_links(links)])
+
+            [schedule(link) for link in links]
+
+            if frontier is not None:
+                await loop.run_in_executor(None, frontier.join)
+
+            while page_tasks:
+                await asyncio.gather(*page_tasks)
+
+            await asyncio.gather(*image_tasks)
     
     def run(self) -> None:
         """Entry point to the scraper"""
-        proxy_handler = ProxyHandler()
+        proxy_handler = ProxyHandler(self.session_handler, self.proxies,
+                                     self.proxy_check_concurrency,
+                                     self.proxies_path, self.proxy_ttl,
+                                     self.base_url, self.proxy_list_url,
+                                     self.proxy_ports)
         proxy_handler.get_proxies()
-        
-        self.proxies = proxy_handler.proxies
 
-        image_handler = ImageHandler(self.images, self.images_queue, 
-                                     self.images_path, self.proxies)
+        image_handler = ImageHandler(self.progress, self.images_queue, 
+                                     self.images_path, self.proxies,
+                                     self.session_handler, self.image_manifest,
+                                     self.retry_policy, self.base_url,
+                                     self.metrics, self.image_workers,
+                                     self.image_max_width, self.image_format)
 
-        for _ in range(self.thread_num):
-            threading.Thread(target=self.work, daemon=True).start()
+        self.metrics.gauge("queue_depth", self.queue.qsize, queue="pages")
+        self.metrics.gauge(
+            "queue_depth", self.images_queue.qsize, queue="images")
+        self.metrics.gauge(
+            "healthy_proxies", lambda: len(self.proxies.healthy()))
+        self.metrics.start(self.metrics_port, self.metrics_path, 
+                           self.metrics_interval)
 
-            threading.Thread(
-                target=image_handler.work, daemon=True).start()
+        if self.incremental:
+            self.revision_handler = RevisionHandler(
+                self.revisions_path, self.session_handler, self.proxies,
+                self.retry_policy)
 
-        self.create_thread_jobs()
+        links = self.add_links(self.read_links())
 
-        csv_handler = CSVHandler(COLUMN_HEADERS, 
-                                 self.profiles, self.history, 
-                                 self.achievements, self.output_path)
-        
-        csv_handler.save_to_excel()
+        if self.parse_workers:
+            self.parse_pool = ProcessPoolExecutor(
+                self.parse_workers, mp_context=get_context("spawn"))
+
+        if self.crawl_mode == "async":
+            asyncio.run(self.crawl_async(image_handler, links))
+        else:
+            for _ in range(self.thread_num):
+                threading.Thread(target=self.work, daemon=True).start()
+
+                threading.Thread(
+                    target=image_handler.work, daemon=True).start()
+
+            self.create_thread_jobs(links)
+
+            self.logger.info(
+                f"Profiles done. Waiting for images: {self.images_queue.qsize()}")
+            self.images_queue.join()
+
+        if self.parse_pool is not None:
+            self.parse_pool.shutdown()
+
+        if self.incremental:
+            self.revision_handler.carry_forward(self.streams)
+
+        for stream in self.streams.values():
+            stream.flush()
+
+        image_handler.close()
+        self.image_manifest.save()
+
+        self.journal_handler.close()
+
+        self.logger.info(f"Records written: {len(self.profiles)} profiles | "
+                         f"{len(self.history)} history rows | "
+                         f"{len(self.achievements)} achievements")
+
+        if self.incremental:
+            self.revision_handler.save_state(
+                self.streams, merge=self.dead_letters)
+
+        if self.dead_letters:
+            self.retry_policy.settle_dead_letters("page", self.saved_links.union(
+                self.revision_handler.unchanged if self.incremental else []))
+
+        proxy_handler.close()
+        self.session_handler.close()
+        self.metrics.stop(self.metrics_path)
+
+        # last, so that a failed conversion loses none of the state above
+        if self.excel_output:
+            csv_handler = CSVHandler(COLUMN_HEADERS, 
+                                     self.profiles, self.history, 
+                                     self.achievements, self.output_path)
+            
+            csv_handler.save_to_excel()
 
 
 if __name__ == "__main__":
-    scraper = LiquipediaScraper()
+    parser = argparse.ArgumentParser(description="Liquipedia profiles scraper")
+    parser.add_argument("--resume", action="store_true",
+                        help="resume the crawl journaled by the last run")
+    parser.add_argument("--dead-letters", action="store_true",
+                        help="only crawl the pages given up by earlier runs")
+    args = parser.parse_args()
+
+    scraper = LiquipediaScraper(resume=args.resume, 
+                                dead_letters=args.dead_letters)
     scraper.run()
\ No newline at end of file
@@ -0,0 +1,327 @@
+import glob
+import json
+import random
+import re
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from utils import Logger
+
+FIXTURES_DIR = "./benchmarks/fixtures"
+
+ORGANIZATION_LINK = re.compile(
+    rb'class="team-template-text"><a href="/valorant/([^"]+)"')
+
+# players per page of a category listing, like MediaWiki
+CATEGORY_PAGE_SIZE = 200
+
+# a 1x1 png padded past the size the image handler accepts
+IMAGE = (b"\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR\x00\x00\x00\x01\x00\x00\x00"
+         b"\x01\x08\x06\x00\x00\x00\x1f\x15\xc4\x89" + b"\x00" * 2048)
+
+
+class MockLiquipedia:
+    def __init__(self, settings:dict) -> None:
+        """
+        A local stand-in for Liquipedia and the free proxy list. Serves the
+        fixture pages for any player or organization, the statistics portal,
+        paginated player categories, the MediaWiki api and images, with
+        configurable latency and faults.
+        The proxies it lists are loopback addresses that all reach the proxy
+        port of this server; the dead ones drop every connection
+
+        :param settings: the "mock_server" section of the settings
+        """
+        self.host = settings["host"]
+        self.port = settings["port"]
+        self.proxy_port = settings["proxy_port"]
+        self.latency = settings["latency"]
+        self.latency_jitter = settings["latency_jitter"]
+        self.error_rate = settings["error_rate"]
+        self.throttle_rate = settings["throttle_rate"]
+        self.retry_after = settings["retry_after"]
+        self.listed_players = [f"Player_{index:05d}" 
+                               for index in range(settings["listed_players"])]
+
+        self.players = self.load_fixtures("players")
+        self.organizations = self.load_fixtures("organizations")
+        self.statistics = self.load_fixtures("statistics")[0][1]
+        self.organization_titles = {
+            unquote(title.decode())
+            for title in ORGANIZATION_LINK.findall(self.statistics)}
+
+        self.proxies = [f"127.0.0.{index + 2}"
+                        for index in range(settings["proxies"])]
+        self.dead_proxies = set(random.Random(0).sample(
+            self.proxies, int(len(self.proxies) * settings["dead_proxy_rate"])))
+
+        self.statuses = {}
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+
+        self.logger = Logger("MockLiquipedia")
+
+    @staticmethod
+    def load_fixtures(kind:str) -> list:
+        """
+        Reads the fixture pages of a given kind as (title, html) pairs
+
+        :param kind: "players", "organizations" or "statistics"
+        """
+        pages = []
+
+        for path in sorted(glob.glob(f"{FIXTURES_DIR}/{kind}/*.html")):
+            with open(path, "rb") as file:
+                title = path.replace("\\", "/").rsplit("/", 1)[1][:-5]
+                pages.append((title.encode(), file.read()))
+
+        return pages
+
+    @staticmethod
+    def revision(title:str) -> int:
+        """
+        Returns a stable fake revision id of a page
+
+        :param title: the page title
+        """
+        return zlib.crc32(title.encode())
+
+    def fixture_page(self, title:str) -> bytes:
+        """
+        Returns an organization fixture for the organizations listed on the
+        statistics portal and a player fixture otherwise, renamed to the
+        requested title
+
+        :param title: the page title
+        """
+        pages = (self.organizations if title in self.organization_titles
+                 else self.players)
+        fixture_title, html = pages[self.revision(title) % len(pages)]
+
+        return html.replace(fixture_title, title.encode())
+
+    def category_page(self, wiki:str, title:str, page_from:str) -> bytes:
+        """
+        Returns one page of a category listing the players, with a link to
+        the next page while there are more players
+
+        :param wiki: the wiki the category belongs to
+        :param title: the category title
+        :param page_from: the first player of the page
+        """
+        start = next((index for index, player in enumerate(self.listed_players)
+                      if player >= page_from), len(self.listed_players))
+        players = self.listed_players[start:start + CATEGORY_PAGE_SIZE]
+        items = "".join(f'<li><a href="/{wiki}/{player}" title="{player}">'
+                        f'{player}</a></li>' for player in players)
+
+        next_page = ""
+
+        if start + CATEGORY_PAGE_SIZE < len(self.listed_players):
+            next_page = (f'<a href="/{wiki}/index.php?title={title}&pagefrom='
+                         f'{self.listed_players[start + CATEGORY_PAGE_SIZE]}'
+                         f'#mw-pages" title="{title}">next page</a>')
+
+        return (f'<html><body><div id="mw-pages"><div class="mw-category">'
+                f'<ul>{items}</ul></div>{next_page}</div></body>'
+                f'</html>').encode()
+
+    def proxy_list(self) -> bytes:
+        """Returns a page shaped like the free proxy list"""
+        rows = "".join(f"<tr><td>{proxy}</td><td>{self.proxy_port}</td>"
+                       f"<td>US</td><td>elite proxy</td></tr>"
+                       for proxy in self.proxies)
+
+        return (f"<html><body><table><thead><tr><th>IP Address</th>"
+                f"<th>Port</th></tr></thead><tbody>{rows}</tbody></table>"
+                f"</body></html>").encode()
+
+    def api(self, query:dict) -> tuple:
+        """
+        Answers the action=query revisions and action=parse api calls
+
+        :param query: the parsed query string
+        """
+        action = query.get("action", [""])[0]
+
+        if action == "query":
+            titles = query.get("titles", [""])[0].split("|")
+            pages = [{"title": title,
+                      "revisions": [{"revid": self.revision(title)}]}
+                     for title in titles]
+
+            body = {"query": {"pages": pages}}
+        elif action == "parse":
+            title = query.get("page", [""])[0]
+            body = {"parse": {
+                "title": title, "displaytitle": title,
+                "text": self.fixture_page(title).decode()}}
+        else:
+            return 400, "application/json", b'{"error": "unknown action"}'
+
+        return 200, "application/json", json.dumps(body).encode()
+
+    def route(self, path:str, query:dict) -> tuple:
+        """
+        Returns the status, content type and body of a request
+
+        :param path: the url path
+        :param query: the parsed query string
+        """
+        if path in ("", "/"):
+            return 200, "text/html", b"<html><body>Liquipedia</body></html>"
+
+        if path == "/proxy-list":
+            return 200, "text/html", self.proxy_list()
+
+        if path.startswith("/commons/images/"):
+            return 200, "image/png", IMAGE
+
+        if path.endswith("/api.php"):
+            return self.api(query)
+
+        wiki, _, title = path.strip("/").partition("/")
+        title = unquote(title)
+
+        if title == "index.php":
+            title = query.get("title", [""])[0]
+
+        if not title:
+            return 404, "text/html", b"<html><body>Not found</body></html>"
+
+        if title == "Portal:Statistics":
+            return 200, "text/html", self.statistics
+
+        if title.startswith("Category:"):
+            return 200, "text/html", self.category_page(
+                wiki, title, query.get("pagefrom", [""])[0])
+
+        return 200, "text/html", self.fixture_page(title)
+
+    def fault(self) -> tuple:
+        """
+        Sleeps for the configured latency and returns an injected error
+        response, or None if the request goes through
+        """
+        time.sleep(self.latency + random.expovariate(1 / self.latency_jitter)
+                   if self.latency_jitter else self.latency)
+
+        draw = random.random()
+
+        if draw < self.throttle_rate:
+            return 429, "text/html", b"<html><body>Rate limited</body></html>"
+
+        if draw < self.throttle_rate + self.error_rate:
+            return 500, "text/html", b"<html><body>Server error</body></html>"
+
+    def count(self, status:int) -> None:
+        """
+        Counts a response by its status code
+
+        :param status: the status code sent
+        """
+        with self.lock:
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+
+    def summary(self) -> str:
+        """Returns the responses sent so far by status and per second"""
+        with self.lock:
+            total = sum(self.statuses.values())
+            statuses = " | ".join(f"{status}: {count}" for status, count
+                                  in sorted(self.statuses.items()))
+
+        elapsed = time.monotonic() - self.started
+
+        return (f"Responses: {total} ({total / elapsed:.1f}/s) | "
+                f"{statuses}")
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self) -> None:
+        """Answers a direct request or one sent through a mock proxy"""
+        mock = self.server.mock
+
+        if self.server.is_proxy and (
+            self.connection.getsockname()[0] in mock.dead_proxies):
+            self.close_connection = True
+            return
+
+        url = urlsplit(self.path)
+        response = mock.fault()
+
+        if response is None:
+            response = mock.route(url.path, parse_qs(url.query))
+
+        status, content_type, body = response
+        etag = f'"{zlib.crc32(body)}"'
+
+        if status == 200 and self.headers.get("If-None-Match") == etag:
+            status, body = 304, b""
+
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+
+        if status in (200, 304):
+            self.send_header("ETag", etag)
+
+        if status == 429:
+            self.send_header("Retry-After", str(mock.retry_after))
+
+        self.end_headers()
+        self.wfile.write(body)
+
+        mock.count(status)
+
+    def log_message(self, format:str, *args) -> None:
+        """Keeps the request log quiet under load"""
+
+
+def serve(mock:MockLiquipedia, host:str, port:int,
+          is_proxy:bool) -> ThreadingHTTPServer:
+    """
+    Starts a threaded server for the mock in the background
+
+    :param mock: the mock site
+    :param host: the address to listen on
+    :param port: the port to listen on
+    :param is_proxy: whether requests arrive through the mock proxies
+    """
+    server = ThreadingHTTPServer((host, port), MockHandler)
+    server.daemon_threads = True
+    server.mock, server.is_proxy = mock, is_proxy
+
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return server
+
+
+if __name__ == "__main__":
+    settings_file = open("./settings/settings.json", "r")
+    settings = json.load(settings_file)["mock_server"]
+    settings_file.close()
+
+    mock = MockLiquipedia(settings)
+
+    servers = [serve(mock, mock.host, mock.port, False),
+               serve(mock, "0.0.0.0", mock.proxy_port, True)]
+
+    mock.logger.info(f"Mock Liquipedia on http://{mock.host}:{mock.port} | "
+                     f"Proxies: {len(mock.proxies)} on port {mock.proxy_port}"
+                     f" ({len(mock.dead_proxies)} dead)")
+
+    try:
+        while True:
+            time.sleep(10)
+            mock.logger.info(mock.summary())
+
+    except KeyboardInterrupt:
+        for server in servers:
+            server.shutdown()
+
+        mock.logger.info(mock.summary())
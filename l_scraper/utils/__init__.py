@@ -1,4 +1,19 @@
 from .logger import Logger
 from .csv_handler import CSVHandler
 from .proxy_handler import ProxyHandler
-from .image_handler import ImageHandler
\ No newline at end of file
+from .image_handler import ImageHandler, ImageJob
+from .session_handler import SessionHandler
+from .async_fetcher import AsyncFetcher
+from .cache_handler import CacheHandler
+from .revision_handler import RevisionHandler
+from .proxy_pool import ProxyPool
+from .rate_limiter import RateLimiter
+from .retry_policy import RetryPolicy
+from .api_handler import ApiHandler
+from .record_stream import RecordStream
+from .journal_handler import JournalHandler
+from .metrics import Metrics
+from .column_store import ColumnStore
+from .progress import Progress
+from .image_manifest import ImageManifest
+from .frontier import Frontier
@@ -0,0 +1,48 @@
+import json
+from urllib.parse import urlencode
+
+from .revision_handler import RevisionHandler
+
+
+class ApiHandler:
+    """
+    Fetches rendered page content through the MediaWiki api instead of the
+    full skinned html page
+    """
+
+    @staticmethod
+    def parse_url(link:str) -> str:
+        """
+        Builds the action=parse url that returns the rendered content of a
+        profile page
+
+        :param link: the link to the player's profile on Liquipedia
+        """
+        api_url, title = RevisionHandler.split_link(link)
+
+        params = {
+            "action": "parse", "page": title, "prop": "text|displaytitle",
+            "redirects": 1, "disableeditsection": 1, "disablelimitreport": 1,
+            "disabletoc": 1, "format": "json", "formatversion": 2
+        }
+
+        return f"{api_url}?{urlencode(params)}"
+
+    @staticmethod
+    def to_html(content:bytes) -> str:
+        """
+        Turns an action=parse response into an html document with the same
+        heading the extractors expect on the full page
+
+        :param content: the body of the api response
+
+        :return: the html document or None if the api returned an error
+        """
+        try:
+            parsed = json.loads(content)["parse"]
+
+        except:
+            return None
+
+        return (f'<html><body><h1 id="firstHeading">{parsed["displaytitle"]}'
+                f'</h1>{parsed["text"]}</body></html>')
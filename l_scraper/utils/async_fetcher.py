@@ -0,0 +1,101 @@
+import asyncio
+import time
+
+import aiohttp
+
+from .metrics import Metrics
+from .proxy_pool import PROXY_ERRORS, ProxyPool
+from .rate_limiter import RateLimiter
+
+
+class AsyncFetcher:
+    def __init__(self, concurrency:int, headers:dict=None,
+                 proxy_pool:ProxyPool=None,
+                 rate_limiter:RateLimiter=None,
+                 metrics:Metrics=None) -> None:
+        """
+        Fetches pages from a single event loop with a cap on the number of
+        requests in flight
+
+        :param concurrency: max number of requests in flight at once
+        :param headers: default headers sent with every request
+        :param proxy_pool: the pool to which the outcome of every proxied 
+        request is reported
+        :param rate_limiter: the limiter every request waits on
+        :param metrics: where the responses and bytes received are counted
+        """
+        self.concurrency = concurrency
+        self.headers = headers or {}
+        self.proxy_pool = proxy_pool
+        self.rate_limiter = rate_limiter
+        self.metrics = metrics
+
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.session = None
+
+    async def __aenter__(self) -> "AsyncFetcher":
+        connector = aiohttp.TCPConnector(limit=self.concurrency)
+        self.session = aiohttp.ClientSession(
+            connector=connector, headers=self.headers)
+
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        await self.session.close()
+
+    async def get(self, url:str, proxy:str=None, timeout:int=10,
+                  **kwargs) -> tuple:
+        """
+        Sends a GET request and returns the status code, the response headers
+        and the response body
+
+        :param url: the url to fetch
+        :param proxy: ip:port of the proxy. None for direct connections
+        :param timeout: total timeout of the request in seconds
+        """
+        if proxy:
+            kwargs["proxy"] = f"http://{proxy}"
+
+        async with self.semaphore:
+            # only requests about to be sent hold a token, so a throttle
+            # reaches the ones still waiting for a slot
+            if self.rate_limiter is not None:
+                await self.rate_limiter.wait_async(url)
+
+            trusted = (not proxy or self.proxy_pool is None 
+                       or self.proxy_pool.is_healthy(proxy))
+            started = time.monotonic()
+
+            try:
+                async with self.session.get(
+                    url, timeout=aiohttp.ClientTimeout(total=timeout), **kwargs
+                ) as response:
+                    result = (response.status, response.headers.copy(), 
+                              await response.read())
+
+            except:
+                self.report(proxy, False, started)
+                raise
+
+        self.report(proxy, result[0] not in PROXY_ERRORS, started)
+
+        if self.metrics is not None:
+            self.metrics.inc("responses_total", status=result[0])
+            self.metrics.inc("bytes_received_total", len(result[2]))
+
+        if self.rate_limiter is not None:
+            self.rate_limiter.feedback(url, result[0], result[1], trusted)
+
+        return result
+
+    def report(self, proxy:str, success:bool, started:float) -> None:
+        """
+        Reports the outcome of a proxied request to the proxy pool
+
+        :param proxy: ip:port of the proxy
+        :param success: whether the proxy returned a usable response
+        :param started: the monotonic time the request was sent
+        """
+        if proxy and self.proxy_pool is not None:
+            self.proxy_pool.report(
+                proxy, success, time.monotonic() - started)
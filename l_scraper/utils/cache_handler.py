@@ -0,0 +1,128 @@
+import hashlib
+import json
+import os
+
+from .logger import Logger
+
+
+class CacheHandler:
+    def __init__(self, cache_dir:str) -> None:
+        """
+        Stores response bodies on disk together with their ETag and
+        Last-Modified values so that repeat runs can send conditional requests
+
+        :param cache_dir: the directory where cached responses are stored
+        """
+        self.cache_dir = cache_dir
+
+        if not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir)
+
+        self.logger = Logger("CacheHandler")
+
+    def get_path(self, url:str) -> str:
+        """
+        Returns the path of a cache entry without extension
+
+        :param url: the url of the cached response
+        """
+        key = hashlib.sha1(url.encode("utf-8")).hexdigest()
+
+        return os.path.join(self.cache_dir, key)
+
+    def read_meta(self, url:str) -> dict:
+        """
+        Reads the validators stored for a given url
+
+        :param url: the url of the cached response
+        """
+        try:
+            with open(f"{self.get_path(url)}.json", "r") as file:
+                return json.load(file)
+
+        except:
+            return {}
+
+    def conditional_headers(self, url:str) -> dict:
+        """
+        Returns the If-None-Match/If-Modified-Since headers for a given url
+
+        :param url: the url to be requested
+        """
+        meta, headers = self.read_meta(url), {}
+
+        if not meta or not os.path.isfile(f"{self.get_path(url)}.body"):
+            return headers
+
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+        return headers
+
+    def load(self, url:str) -> bytes:
+        """
+        Loads the cached body of a given url
+
+        :param url: the url of the cached response
+        """
+        try:
+            with open(f"{self.get_path(url)}.body", "rb") as file:
+                return file.read()
+
+        except:
+            return None
+
+    def store(self, url:str, headers:dict, content:bytes) -> None:
+        """
+        Stores a response body with its validators. Responses without an ETag
+        or Last-Modified header are not stored since they can't be revalidated
+
+        :param url: the url of the response
+        :param headers: the response headers
+        :param content: the response body
+        """
+        meta = {
+            "url": url,
+            "etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified")
+        }
+
+        if not meta["etag"] and not meta["last_modified"]:
+            return
+
+        path = self.get_path(url)
+
+        try:
+            with open(f"{path}.body.tmp", "wb") as file:
+                file.write(content)
+
+            with open(f"{path}.json.tmp", "w") as file:
+                json.dump(meta, file)
+
+            os.replace(f"{path}.body.tmp", f"{path}.body")
+            os.replace(f"{path}.json.tmp", f"{path}.json")
+
+        except:
+            self.logger.warn(f"Could not cache response for {url}")
+
+    def resolve(self, url:str, status:int, headers:dict,
+                content:bytes) -> bytes:
+        """
+        Returns the body to use for a response: the cached body on a 304, the
+        new body on a 200 (which is then cached) and None otherwise
+
+        :param url: the url of the response
+        :param status: the response status code
+        :param headers: the response headers
+        :param content: the response body
+        """
+        if status == 304:
+            return self.load(url)
+
+        if status == 200:
+            self.store(url, headers, content)
+
+            return content
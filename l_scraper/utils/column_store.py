@@ -0,0 +1,107 @@
+import threading
+from array import array
+
+import numpy as np
+import pandas as pd
+
+
+class ColumnStore:
+    def __init__(self, columns:list=None) -> None:
+        """
+        A thread safe, list-like accumulator that keeps records as columns
+        of dictionary codes instead of one dict per record. Every distinct
+        value of a column is stored once, so repeated values such as team
+        names, nationalities and the player ID of every row cost 4 bytes
+
+        :param columns: the schema of the columns in order. Columns that are
+        not in the schema are added after it as they show up
+        """
+        self.codes = {}
+        self.values = {}
+        self.lookups = {}
+        self.count = 0
+
+        self.lock = threading.Lock()
+
+        for column in columns or []:
+            self.add_column(column)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def add_column(self, column:str) -> None:
+        """
+        Adds an empty column, missing in every record appended so far. Must
+        be called with the lock held or before the store is shared
+
+        :param column: the column name
+        """
+        self.codes[column] = array("i", [-1]) * self.count
+        self.values[column] = []
+        self.lookups[column] = {}
+
+    def encode(self, column:str, value) -> int:
+        """
+        Returns the code of a value in a column, adding the value if it is
+        new. Must be called with the lock held
+
+        :param column: the column name
+        :param value: the value to encode
+        """
+        lookup = self.lookups[column]
+        code = lookup.get(value)
+
+        if code is None:
+            code = lookup[value] = len(self.values[column])
+            self.values[column].append(value)
+
+        return code
+
+    def append(self, record:dict) -> None:
+        """
+        Adds a record
+
+        :param record: a dictionary of column to value
+        """
+        with self.lock:
+            for column in record:
+                if column not in self.codes:
+                    self.add_column(column)
+
+            for column, codes in self.codes.items():
+                value = record.get(column)
+
+                codes.append(
+                    -1 if value is None else self.encode(column, value))
+
+            self.count += 1
+
+    def extend(self, records) -> None:
+        """
+        Adds several records
+
+        :param records: an iterable of dictionaries of column to value
+        """
+        for record in records:
+            self.append(record)
+
+    def to_dataframe(self, columns:list=None) -> pd.DataFrame:
+        """
+        Returns the records as a DataFrame of categorical columns. pandas
+        copies the codes into the smallest integer type that fits the
+        categories, so the DataFrame is a snapshot: records appended later
+        do not show up in it
+
+        :param columns: the columns to include, in order. Defaults to all of
+        them; unknown columns are skipped
+        """
+        with self.lock:
+            if columns is None:
+                columns = list(self.codes)
+
+            return pd.DataFrame({
+                column: pd.Categorical.from_codes(
+                    np.frombuffer(self.codes[column], dtype=np.intc),
+                    self.values[column])
+                for column in columns if column in self.codes
+            }, copy=False)
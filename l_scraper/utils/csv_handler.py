@@ -1,7 +1,11 @@
 import pandas as pd
 
+from .column_store import ColumnStore
 from .logger import Logger
 
+# rows of an excel sheet, including the header row
+EXCEL_MAX_ROWS = 1048576
+
 
 class CSVHandler:
     def __init__(self, headers:list, profiles:list, history:list, 
@@ -15,21 +19,27 @@ class CSVHandler:
         self.output_path = file_dir
 
     def dict_to_dataframe(self) -> pd.DataFrame:
-        """Converts dictionary to dataframe"""
+        """
+        Converts dictionary to dataframe. The records may be lists or record
+        streams read back from disk; they are collected into column stores
+        one at a time instead of being loaded as dicts
+        """
         self.logger.info("Converting dictionary to dataframe...")
-        
-        profiles_df = pd.DataFrame.from_dict(self.profiles)
-        column_names = profiles_df.columns.values.tolist()
 
-        profiles_df = profiles_df[
-            [column for column in self.headers if column in column_names]
-        ]
+        profiles, history, achievements = (
+            ColumnStore(self.headers), ColumnStore(), ColumnStore())
 
-        history_df = pd.DataFrame.from_dict(self.history)
+        profiles.extend(self.profiles)
+        history.extend(self.history)
+        achievements.extend(self.achievements)
 
-        achievements_df = pd.DataFrame.from_dict(self.achievements)
+        profiles_df = profiles.to_dataframe(self.headers)
+        profiles_df = profiles_df[[
+            column for column in profiles_df.columns 
+            if profiles_df[column].notna().any()]]
 
-        return profiles_df, history_df, achievements_df
+        return (profiles_df, history.to_dataframe(), 
+                achievements.to_dataframe())
     
     def save_to_excel(self) -> None:
         """Saves data to excel file"""
@@ -37,10 +47,30 @@ class CSVHandler:
 
         profiles, history, achievements = self.dict_to_dataframe()
 
-        profiles.to_excel(self.output_path, sheet_name="profiles", index=False)
+        with pd.ExcelWriter(self.output_path) as writer:
+            self.write_sheets(writer, profiles, "profiles")
+            self.write_sheets(writer, history, "history")
+            self.write_sheets(writer, achievements, "achievements")
+
+        self.logger.info("Records saved!")
+
+    def write_sheets(self, writer:pd.ExcelWriter, df:pd.DataFrame, 
+                     name:str) -> None:
+        """
+        Writes a dataframe to a sheet, split over "name", "name_2", ... sheets
+        when it has more rows than an excel sheet holds
+
+        :param writer: the excel file being written
+        :param df: the records
+        :param name: the name of the first sheet
+        """
+        rows = EXCEL_MAX_ROWS - 1
+
+        for part, start in enumerate(range(0, max(len(df), 1), rows)):
+            sheet_name = name if not part else f"{name}_{part + 1}"
 
-        with pd.ExcelWriter(self.output_path, mode="a") as writer:  
-            history.to_excel(writer, sheet_name="history", index=False)
-            achievements.to_excel(writer, sheet_name="achievements", index=False)
+            df.iloc[start:start + rows].to_excel(
+                writer, sheet_name=sheet_name, index=False)
 
-        self.logger.info("Records saved!")
\ No newline at end of file
+        if len(df) > rows:
+            self.logger.info(f"{name} split over {-(-len(df) // rows)} sheets")
\ No newline at end of file
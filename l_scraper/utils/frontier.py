@@ -0,0 +1,202 @@
+import threading
+from queue import Queue
+from urllib.parse import parse_qs, unquote, urljoin, urlsplit
+
+from bs4 import BeautifulSoup
+
+from .logger import Logger
+from .metrics import Metrics
+from .proxy_pool import ProxyPool
+from .retry_policy import RetryPolicy
+from .session_handler import SessionHandler
+
+# anchors that lead to a player profile on category and portal pages
+PROFILE_LINKS = "#mw-pages li a, span.inline-player a"
+# anchors that lead to more listing pages
+SUBCATEGORY_LINKS = "#mw-subcategories a"
+NEXT_PAGE = "next page"
+
+
+class Frontier:
+    def __init__(self, listing_urls:list, workers:int,
+                 session_handler:SessionHandler, proxies:ProxyPool,
+                 retry_policy:RetryPolicy, metrics:Metrics=None) -> None:
+        """
+        Discovers player profiles by walking category and portal listing
+        pages. Every worker thread fetches one listing page at a time and
+        queues its next page, subcategories and portal subpages for the other
+        workers, so the pagination of several listings is followed at once.
+        The profile links of every page are handed over as soon as the page
+        is parsed, so the crawl starts before the discovery is over
+
+        :param listing_urls: the category and portal pages to start from
+        :param workers: the number of listing pages fetched at once
+        :param session_handler: pooled sessions shared with the scraper
+        :param proxies: the pool of working proxies
+        :param retry_policy: bounds the retries of every listing page
+        :param metrics: where the listing pages and profiles are counted
+        """
+        self.listing_urls = listing_urls
+        self.workers = workers
+        self.session_handler = session_handler
+        self.proxies = proxies
+        self.retry_policy = retry_policy
+        self.metrics = metrics
+
+        self.listings = Queue()
+        self.seen_listings = set()
+        self.seen_profiles = set()
+        self.lock = threading.Lock()
+        self.on_links = None
+
+        self.logger = Logger("Frontier")
+
+    @staticmethod
+    def page_title(url:str) -> tuple:
+        """
+        Returns the wiki and the title of a page, including the paginated
+        index.php urls of a category
+
+        :param url: the url of the page
+        """
+        parts = urlsplit(url)
+        wiki, _, title = parts.path.strip("/").partition("/")
+
+        if title == "index.php":
+            title = parse_qs(parts.query).get("title", [""])[0]
+
+        return wiki, unquote(title).replace("_", " ")
+
+    def add_listing(self, url:str) -> None:
+        """
+        Queues a listing page unless it was queued before
+
+        :param url: the url of the listing page
+        """
+        url = urlsplit(url)._replace(fragment="").geturl()
+
+        with self.lock:
+            if url in self.seen_listings:
+                return
+
+            self.seen_listings.add(url)
+
+        self.listings.put(url)
+
+    def fetch_listing(self, url:str) -> bytes:
+        """
+        Fetches a listing page
+
+        :param url: the url of the listing page
+
+        :return: the html of the page or None once the retries run out
+        """
+        for _ in self.retry_policy.attempts():
+            try:
+                proxy = self.proxies.choose()
+                response = self.session_handler.get(url, proxy, timeout=10)
+
+                if response.status_code == 200:
+                    return response.content
+
+            except:pass
+
+        self.retry_policy.dead_letter("listing", url, "could not fetch listing")
+
+    def extract_links(self, url:str, content:bytes) -> tuple:
+        """
+        Extracts the profile links and the further listing pages of a listing
+        page
+
+        :param url: the url of the listing page
+        :param content: the html of the page
+
+        :return: the new profile links and the listing page urls
+        """
+        soup = BeautifulSoup(content, "lxml")
+        wiki, title = self.page_title(url)
+        profiles, listings = [], []
+
+        for anchor in soup.select(PROFILE_LINKS):
+            link = urljoin(url, anchor.get("href", ""))
+            link_wiki, link_title = self.page_title(link)
+
+            # red links, flags and other namespaces are not profiles
+            if ("new" in anchor.get("class", []) or link_wiki != wiki
+                or ":" in link_title or urlsplit(link).query):
+                continue
+
+            profiles.append(urlsplit(link)._replace(fragment="").geturl())
+
+        for anchor in soup.select(SUBCATEGORY_LINKS):
+            listings.append(urljoin(url, anchor.get("href", "")))
+
+        for anchor in soup.find_all("a", href=True):
+            link = urljoin(url, anchor["href"])
+            link_wiki, link_title = self.page_title(link)
+
+            if anchor.get_text(strip=True) == NEXT_PAGE or (
+                link_wiki == wiki and link_title.startswith(f"{title}/")):
+                listings.append(link)
+
+        soup.decompose()
+
+        with self.lock:
+            profiles = [link for link in dict.fromkeys(profiles)
+                        if link not in self.seen_profiles]
+            self.seen_profiles.update(profiles)
+
+        return profiles, listings
+
+    def start(self, on_links) -> None:
+        """
+        Starts the discovery in the background
+
+        :param on_links: called from the worker threads with the new profile
+        links of every listing page
+        """
+        self.on_links = on_links
+
+        for url in self.listing_urls:
+            self.add_listing(url)
+
+        for _ in range(self.workers):
+            threading.Thread(target=self.work, daemon=True).start()
+
+    def join(self) -> None:
+        """Waits until every listing page has been walked"""
+        self.listings.join()
+
+        self.logger.info(f"Discovery done. Listing pages: "
+                         f"{len(self.seen_listings)} | "
+                         f"Profiles found: {len(self.seen_profiles)}")
+
+    def work(self) -> None:
+        """Gets a listing page from the queue and hands over its profiles"""
+        while True:
+            url = self.listings.get()
+
+            try:
+                content = self.fetch_listing(url)
+
+                if content is not None:
+                    profiles, listings = self.extract_links(url, content)
+
+                    for listing in listings:
+                        self.add_listing(listing)
+
+                    if profiles:
+                        self.on_links(profiles)
+
+                    if self.metrics is not None:
+                        self.metrics.inc("listing_pages_total")
+                        self.metrics.inc("profiles_found_total", len(profiles))
+
+                    self.logger.progress(
+                        f"Listing pages: {len(self.seen_listings)} | "
+                        f"Profiles found: {len(self.seen_profiles)}")
+
+            except:
+                self.logger.warn(f"Could not walk listing page {url}")
+
+            self.listings.task_done()
@@ -1,111 +1,476 @@
+import hashlib
+import io
 import os
-import random
+import re
 import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
 from queue import Queue
+from typing import NamedTuple
 
 import requests
 from bs4 import BeautifulSoup
 
+from .image_manifest import ImageManifest
 from .logger import Logger
+from .metrics import Metrics
+from .progress import Progress
+from .proxy_pool import ProxyPool
+from .retry_policy import RetryPolicy
+from .session_handler import SessionHandler
+
+# the width in a MediaWiki thumbnail url, e.g. /thumb/d/d6/A.jpg/600px-A.jpg
+THUMB_WIDTH = re.compile(r"/(\d+)px-([^/]+)$")
+
+# the first bytes of every image format that can be stored
+SIGNATURES = [
+    (b"\x89PNG\r\n\x1a\n", ".png"), (b"\xff\xd8\xff", ".jpg"),
+    (b"GIF87a", ".gif"), (b"GIF89a", ".gif"), (b"<svg", ".svg"),
+    (b"<?xml", ".svg")
+]
+
+PIL_FORMATS = {"png": "PNG", "jpg": "JPEG", "jpeg": "JPEG", "webp": "WEBP"}
+
+# the extension every image was saved under before the manifest existed
+LEGACY_EXTENSION = ".png"
+
+
+class ImageJob(NamedTuple):
+    """A player's image to download, resolved while the page was extracted"""
+    name: str
+    image_url: str
+    fallback_url: str = None
+
+
+def image_extension(content:bytes, image_url:str="") -> str:
+    """
+    Returns the file extension of an image from its first bytes, falling back
+    to the extension in its url
+
+    :param content: the image bytes
+    :param image_url: relative path to the image on the server
+    """
+    if content[:4] == b"RIFF" and content[8:12] == b"WEBP":
+        return ".webp"
+
+    for signature, extension in SIGNATURES:
+        if content.lstrip()[:len(signature)] == signature:
+            return extension
+
+    extension = os.path.splitext(image_url)[1].lower()
+
+    return ".jpg" if extension == ".jpeg" else extension or ".png"
+
+
+def normalize_image(content:bytes, image_url:str, max_width:int,
+                    image_format:str) -> tuple:
+    """
+    Checks that an image decodes and optionally shrinks it to a max width and
+    re-encodes it. Runs in the image worker processes
+
+    :param content: the image bytes
+    :param image_url: relative path to the image on the server
+    :param max_width: wider images are resized to this width. 0 keeps the size
+    :param image_format: "png", "jpg" or "webp" to re-encode to, or "" to keep
+    the format
+
+    :return: the image bytes and their file extension, or None if the image
+    does not decode
+    """
+    from PIL import Image
+
+    extension = image_extension(content, image_url)
+
+    if extension == ".svg":
+        return content, extension
+
+    try:
+        with Image.open(io.BytesIO(content)) as image:
+            image.verify()
+
+        image = Image.open(io.BytesIO(content))
+        image.load()
+
+    except Exception:
+        return None
+
+    resize = max_width and image.width > max_width
+
+    if not resize and not image_format:
+        return content, extension
+
+    if resize:
+        image.thumbnail((max_width, image.height))
+
+    pil_format = PIL_FORMATS.get(image_format) or image.format or "PNG"
+
+    if pil_format == "JPEG" and image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+
+    output = io.BytesIO()
+    image.save(output, pil_format)
+
+    return output.getvalue(), image_extension(output.getvalue())
 
 
 class ImageHandler:
-    def __init__(self, images:list, queue:Queue, dir:str, proxies:list) -> None:
+    def __init__(self, progress:Progress, queue:Queue, dir:str,
+                 proxies:ProxyPool, 
+                 session_handler:SessionHandler, manifest:ImageManifest,
+                 retry_policy:RetryPolicy, base_url:str,
+                 metrics:Metrics=None, process_workers:int=0, 
+                 max_width:int=0, image_format:str="") -> None:
         """
         Scrapes images from liquipedia and stores them locally
 
-        :param images: a list to store image urls
+        :param progress: where the downloaded images are counted
         :param queue: a queue where image thread jobs are stored for processing
         :param dir: the directory where images will be stored
-        :param proxies: list of proxies
+        :param proxies: the pool of working proxies
+        :param session_handler: pooled sessions shared with the scraper
+        :param manifest: the index of the downloaded images
+        :param retry_policy: bounds the retries of every image
+        :param base_url: the site the images are downloaded from
+        :param metrics: where the image download latency is recorded
+        :param process_workers: number of processes that check and normalize
+        the downloaded images. 0 stores them as downloaded
+        :param max_width: images wider than this are resized in the worker
+        processes. 0 keeps the size
+        :param image_format: "png", "jpg" or "webp" to re-encode the images to
+        in the worker processes, or "" to keep their format
         """
 
-        self.images = images
+        self.progress = progress
         self.images_path = dir
         self.images_queue = queue
         self.proxies = proxies
+        self.session_handler = session_handler
+        self.manifest = manifest
+        self.retry_policy = retry_policy
+        self.base_url = base_url
+        self.metrics = metrics
+        self.max_width = max_width
+        self.image_format = image_format
 
         if not os.path.exists(self.images_path):
             os.makedirs(self.images_path)
 
         self.logger = Logger("ImageHandler")
 
-    def check_image_exists(self, filepath: str) -> bool:
-        """Checks if an image has already been downloaded"""
-        if os.path.isfile(filepath) and os.stat(filepath).st_size > 500:
-            return True
-        else:
-            return False
-    
-    def extract_image_url(self, soup:BeautifulSoup, file_path:str) -> None:
+        self.process_pool = None
+
+        if process_workers:
+            try:
+                import PIL
+
+                self.process_pool = ProcessPoolExecutor(
+                    process_workers, mp_context=get_context("spawn"))
+
+            except ImportError:
+                self.logger.warn("Pillow is not installed. Images are "
+                                 "stored as downloaded")
+
+    @staticmethod
+    def find_image_url(soup:BeautifulSoup, width:int=0) -> tuple:
         """
-        Extracts an image url from html response from the server
+        Finds the player's image url in html response from the server. With a
+        target width, picks the smallest of the src and srcset candidates that
+        is at least that wide and asks MediaWiki for a thumbnail of exactly
+        that width when the candidate is a wider thumbnail
 
         :param soup: a beautifulsoup object of html response from the server
-        :param file_path: relative path to the image in the local directory
+        :param width: the target image width in pixels. 0 takes the src as is
+
+        :return: relative path to the image on the server or None, and the
+        candidate it was resized from or None if it was not resized
         """
-        images = soup.select("div", {"class":"infobox-image lightmode"})
+        image = soup.select_one("div.infobox-image.lightmode a.image img")
+
+        if image is None:
+            image = soup.select_one("div a.image img")
+
+        try:
+            src = image["src"]
+
+        except:
+            return None, None
 
-        for image in images:
+        if not width:
+            return src, None
+
+        try:
+            src_width = int(image.get("width") or 
+                            THUMB_WIDTH.search(src).group(1))
+
+        except:
+            return src, None
+
+        candidates = [(src_width, src)]
+
+        for candidate in image.get("srcset", "").split(","):
             try:
-                a_tag = image.find("a", {"class":"image"})
-                image_url = a_tag.img["src"]
-                
-                self.download_image(image_url, file_path)
+                url, descriptor = candidate.split()
 
-                break
+                if descriptor.endswith("x"):
+                    candidates.append(
+                        (int(src_width * float(descriptor[:-1])), url))
+                elif descriptor.endswith("w"):
+                    candidates.append((int(descriptor[:-1]), url))
 
-            except:pass
-    
-    def download_image(self, image_url:str, dir:str) -> None:
+            except ValueError:
+                continue
+
+        wide_enough = [candidate for candidate in candidates 
+                       if candidate[0] >= width]
+
+        if wide_enough:
+            candidate_width, url = min(wide_enough)
+        else:
+            candidate_width, url = max(candidates)
+
+        # MediaWiki may not render the resized thumbnail, so the candidate
+        # is kept to fall back to
+        if candidate_width > width and THUMB_WIDTH.search(url):
+            return THUMB_WIDTH.sub(rf"/{width}px-\2", url), url
+
+        return url, None
+
+    def image_path(self, name:str, extension:str) -> str:
+        """
+        Returns the local file path of a player's image
+
+        :param name: the name of the player
+        :param extension: the file extension of the image
+        """
+        return os.path.join(self.images_path, f"{name}{extension}")
+
+    def normalize(self, content:bytes, image_url:str) -> tuple:
         """
-        Downloads an image from a given url and saves to given file path
+        Returns the image bytes to store and their file extension, checked
+        and normalized in the worker processes if there are any
 
+        :param content: the downloaded image bytes
         :param image_url: relative path to the image on the server
-        :param dir: the relative path to an image on local directory
+
+        :return: the bytes and the extension, or None if the image is broken
         """
-        
-        while True:
-            response = self.fetch_image(image_url)
-            try:
-                with open(dir, "wb") as file:
-                    shutil.copyfileobj(response.raw, file)
+        if self.process_pool is None:
+            return content, image_extension(content, image_url)
+
+        return self.process_pool.submit(
+            normalize_image, content, image_url, self.max_width, 
+            self.image_format).result()
 
-                if os.stat(dir).st_size > 500:
-                    self.images.append(image_url)
+    def close(self) -> None:
+        """Shuts down the image worker processes"""
+        if self.process_pool is not None:
+            self.process_pool.shutdown()
 
-                    break
+    def reuse_image(self, name:str, image_url:str) -> bool:
+        """
+        Skips the download if the player's image is up to date, or copies it
+        from another player whose image has the same source url
+
+        :param name: the name of the player
+        :param image_url: relative path to the image on the server
+
+        :return: True if nothing has to be downloaded
+        """
+        if self.manifest.is_fresh(name, image_url):
+            return True
+
+        shared = self.manifest.find_shared(name, image_url)
+
+        if shared is None:
+            return False
+
+        file_path = self.image_path(
+            name, os.path.splitext(shared["file"])[1])
+
+        self.link_file(shared["file"], file_path)
+        self.remove_previous(name, file_path)
+        self.manifest.share(name, file_path, shared)
+        self.progress.inc("images")
+
+        return True
+
+    @staticmethod
+    def link_file(source:str, target:str) -> None:
+        """
+        Makes a file hold the same image as another one, with a hard link
+        where the file system supports it
+
+        :param source: the existing image file
+        :param target: the image file to create
+        """
+        if os.path.abspath(source) == os.path.abspath(target):
+            return
+
+        if os.path.exists(target):
+            os.remove(target)
+
+        try:
+            os.link(source, target)
+
+        except OSError:
+            shutil.copyfile(source, target)
+
+    def remove_previous(self, name:str, file_path:str) -> None:
+        """
+        Removes a player's previous image file when the new image is saved
+        under another name, e.g. because its format changed. Players missing
+        from the manifest may still have an image saved before it existed
+
+        :param name: the name of the player
+        :param file_path: the path of the new image
+        """
+        previous = self.manifest.entries.get(name)
+
+        if previous is None:
+            previous = {"file": self.image_path(name, LEGACY_EXTENSION)}
+
+        if (previous["file"] != file_path 
+            and os.path.isfile(previous["file"])):
+            os.remove(previous["file"])
+
+    def download_player_image(self, name:str, image_url:str,
+                              fallback_url:str=None) -> None:
+        """
+        Downloads a player's image unless the manifest says it is up to date,
+        from the fallback url if the image url cannot be saved
+
+        :param name: the name of the player
+        :param image_url: relative path to the image on the server
+        :param fallback_url: relative path to the image the image url was
+        resized from, or None
+        """
+        urls = [url for url in dict.fromkeys((image_url, fallback_url)) if url]
+
+        if any(self.reuse_image(name, url) for url in urls):
+            return
+
+        for url in urls:
+            if self.download_from(name, url):
+                return
+
+        self.retry_policy.dead_letter(
+            "image", f"{self.base_url}{image_url}", "could not save image")
+
+    def download_from(self, name:str, image_url:str) -> bool:
+        """
+        Downloads a player's image from a given url and saves it
+
+        :param name: the name of the player
+        :param image_url: relative path to the image on the server
+
+        :return: True if the image is saved and up to date
+        """
+        for _ in self.retry_policy.attempts():
+            response = self.fetch_image(name, image_url)
+
+            if response is None:
+                return False
+
+            try:
+                if self.store_image(name, image_url, response.status_code,
+                                    response.headers, response.content):
+                    return True
 
             except:
                 self.logger.warn("Could not download image. Retrying...")
+
+        return False
     
-    def fetch_image(self, image_url:str) -> None:
+    def fetch_image(self, name:str, image_url:str) -> requests.Response:
         """
-        Fetches an image page from the server and returns the response if status
-        equal to 200
+        Fetches an image from the server, revalidating the downloaded copy
+        if there is one
 
+        :param name: the name of the player
         :param image_url: relative path to the image in the server
+
+        :return: a 200 or 304 response, or None once the retries run out
         """
-        while True:
+        url = f"{self.base_url}{image_url}"
+
+        for _ in self.retry_policy.attempts():
             try:
-                proxy = {"https":f"http://{random.choice(self.proxies)}"}
-                url = f"https://liquipedia.net{image_url}"
+                proxy = self.proxies.choose()
+                headers = self.manifest.conditional_headers(name, image_url)
 
-                response = requests.get(url, proxies=proxy, timeout=30, stream=True)
-                response.raw.decode_content = True
+                started = time.monotonic()
+                response = self.session_handler.get(
+                    url, proxy, timeout=30, headers=headers)
 
-                if response.status_code == 200:
+                if self.metrics is not None:
+                    self.metrics.observe("stage_seconds", 
+                                         time.monotonic() - started, 
+                                         stage="image")
+
+                if response.status_code in (200, 304):
                     return response
 
             except:pass
     
+    def store_image(self, name:str, image_url:str, status:int, headers:dict,
+                    content:bytes) -> bool:
+        """
+        Saves the body of an image response under the extension of its real
+        format unless an image with the same content is already on disk, and
+        records it in the manifest
+
+        :param name: the name of the player
+        :param image_url: relative path to the image on the server
+        :param status: the response status code
+        :param headers: the response headers
+        :param content: the image bytes
+
+        :return: True if the player's image is saved and up to date
+        """
+        if status == 304 and self.manifest.current(name, image_url):
+            self.manifest.touch(name)
+            return True
+
+        if status != 200 or len(content) <= 500:
+            return False
+
+        content_hash = hashlib.sha1(content).hexdigest()
+        existing = self.manifest.find_by_hash(content_hash)
+
+        if existing is None:
+            normalized = self.normalize(content, image_url)
+
+            if normalized is None:
+                return False
+
+            content, extension = normalized
+            file_path = self.image_path(name, extension)
+
+            # a new file rather than a rewrite, other players may link to it
+            with open(f"{file_path}.tmp", "wb") as file:
+                file.write(content)
+
+            os.replace(f"{file_path}.tmp", file_path)
+        else:
+            file_path = self.image_path(
+                name, os.path.splitext(existing)[1])
+
+            self.link_file(existing, file_path)
+
+        self.remove_previous(name, file_path)
+
+        self.manifest.record(name, image_url, file_path, headers, 
+                             content_hash)
+        self.progress.inc("images")
+
+        return True
+
     def work(self) -> None:
-        """Gets a page from the queue and scans for image url"""
+        """Gets a player's image url from the queue and downloads the image"""
         while True:
-            soup, name = self.images_queue.get()
-            file_path = f"./images/{name}.png"
-
-            if not self.check_image_exists(file_path):
-                self.extract_image_url(soup, file_path)
+            job = self.images_queue.get()
+            self.download_player_image(
+                job.name, job.image_url, job.fallback_url)
 
             self.images_queue.task_done()
\ No newline at end of file
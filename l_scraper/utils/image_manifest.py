@@ -0,0 +1,225 @@
+import json
+import os
+import threading
+import time
+
+from .logger import Logger
+
+
+class ImageManifest:
+    def __init__(self, path:str, refresh_interval:float) -> None:
+        """
+        An index of the downloaded images, loaded once at startup, mapping
+        every player to the source url, validators and content hash of their
+        image. Images are only fetched again when the source url changes or
+        the refresh interval is over, and then with a conditional request
+
+        :param path: the json file the manifest is kept in
+        :param refresh_interval: seconds after which an unchanged image is
+        revalidated with the server
+        """
+        self.path = path
+        self.refresh_interval = refresh_interval
+
+        self.lock = threading.Lock()
+        self.entries = self.load()
+
+        # content hash and source url to the players that have them, so that
+        # lookups do not scan the whole manifest
+        self.by_hash, self.by_url = {}, {}
+
+        for name, entry in self.entries.items():
+            self.index(name, entry)
+
+        self.logger = Logger("ImageManifest")
+
+    def load(self) -> dict:
+        """Loads the manifest saved by the last run"""
+        try:
+            with open(self.path, "r") as file:
+                return json.load(file)
+
+        except:
+            return {}
+
+    def save(self) -> None:
+        """Saves the manifest for the next runs"""
+        with self.lock:
+            entries = dict(self.entries)
+
+        directory = os.path.dirname(self.path)
+
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        with open(f"{self.path}.tmp", "w") as file:
+            json.dump(entries, file)
+
+        os.replace(f"{self.path}.tmp", self.path)
+
+    def index(self, name:str, entry:dict) -> None:
+        """
+        Adds the entry of a player to the lookups. Must be called with the
+        lock held
+
+        :param name: the name of the player
+        :param entry: the player's entry
+        """
+        self.by_hash.setdefault(entry["hash"], set()).add(name)
+        self.by_url.setdefault(entry["url"], set()).add(name)
+
+    def unindex(self, name:str) -> None:
+        """
+        Removes the current entry of a player from the lookups. Must be
+        called with the lock held
+
+        :param name: the name of the player
+        """
+        entry = self.entries.get(name)
+
+        if entry is None:
+            return
+
+        for lookup, key in ((self.by_hash, entry["hash"]),
+                            (self.by_url, entry["url"])):
+            names = lookup.get(key)
+
+            if names is not None:
+                names.discard(name)
+
+                if not names:
+                    del lookup[key]
+
+    def set_entry(self, name:str, entry:dict) -> None:
+        """
+        Replaces the entry of a player. Must be called with the lock held
+
+        :param name: the name of the player
+        :param entry: the player's new entry
+        """
+        self.unindex(name)
+        self.entries[name] = entry
+        self.index(name, entry)
+
+    def current(self, name:str, image_url:str) -> dict:
+        """
+        Returns the entry of a player if it is for the same source url and
+        its file still exists, otherwise None
+
+        :param name: the name of the player
+        :param image_url: relative path to the player's image on the server
+        """
+        entry = self.entries.get(name)
+
+        if (entry is None or entry["url"] != image_url
+            or not os.path.isfile(entry["file"])):
+            return None
+
+        return entry
+
+    def is_fresh(self, name:str, image_url:str) -> bool:
+        """
+        Tells whether a player's image is up to date without asking the
+        server
+
+        :param name: the name of the player
+        :param image_url: relative path to the player's image on the server
+        """
+        entry = self.current(name, image_url)
+
+        return (entry is not None
+                and time.time() - entry["checked"] < self.refresh_interval)
+
+    def conditional_headers(self, name:str, image_url:str) -> dict:
+        """
+        Returns the If-None-Match/If-Modified-Since headers for a player's
+        image, or no headers if the image has to be fetched in full
+
+        :param name: the name of the player
+        :param image_url: relative path to the player's image on the server
+        """
+        entry, headers = self.current(name, image_url), {}
+
+        if entry is None:
+            return headers
+
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+        return headers
+
+    def find_by_hash(self, content_hash:str) -> str:
+        """
+        Returns an existing image file with given content, or None
+
+        :param content_hash: the sha1 of the image bytes
+        """
+        with self.lock:
+            files = [self.entries[name]["file"]
+                     for name in self.by_hash.get(content_hash, ())]
+
+        for file_path in files:
+            if os.path.isfile(file_path):
+                return file_path
+
+    def find_shared(self, name:str, image_url:str) -> dict:
+        """
+        Returns the fresh entry of another player with the same source url,
+        or None
+
+        :param name: the name of the player
+        :param image_url: relative path to the player's image on the server
+        """
+        with self.lock:
+            others = [other for other in self.by_url.get(image_url, ())
+                      if other != name]
+
+        for other in others:
+            if self.is_fresh(other, image_url):
+                return self.entries[other]
+
+    def record(self, name:str, image_url:str, file_path:str, headers:dict,
+               content_hash:str) -> None:
+        """
+        Records the image saved for a player
+
+        :param name: the name of the player
+        :param image_url: relative path to the player's image on the server
+        :param file_path: where the image is saved
+        :param headers: the response headers with the validators
+        :param content_hash: the sha1 of the image bytes
+        """
+        headers = headers or {}
+
+        with self.lock:
+            self.set_entry(name, {
+                "url": image_url, "file": file_path, "hash": content_hash,
+                "etag": headers.get("ETag"),
+                "last_modified": headers.get("Last-Modified"),
+                "checked": time.time()
+            })
+
+    def share(self, name:str, file_path:str, entry:dict) -> None:
+        """
+        Records a copy of another player's image with the same source url
+
+        :param name: the name of the player
+        :param file_path: where the copy is saved
+        :param entry: the entry of the image that was copied
+        """
+        with self.lock:
+            self.set_entry(name, dict(entry, file=file_path))
+
+    def touch(self, name:str) -> None:
+        """
+        Marks a player's image as checked after the server answered that it
+        did not change
+
+        :param name: the name of the player
+        """
+        with self.lock:
+            if name in self.entries:
+                self.entries[name]["checked"] = time.time()
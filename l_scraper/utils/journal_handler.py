@@ -0,0 +1,123 @@
+import json
+import os
+import threading
+
+from .logger import Logger
+
+
+class JournalHandler:
+    def __init__(self, path:str, resume:bool) -> None:
+        """
+        Appends every finished page and its records to a journal on disk so
+        that a crashed crawl can be resumed where it stopped. Only the offset
+        of every page in the journal is kept in memory; its records are read
+        back when they are restored
+
+        :param path: the journal file
+        :param resume: whether to keep the pages journaled by the last run
+        """
+        self.path = path
+        self.lock = threading.Lock()
+
+        self.logger = Logger("JournalHandler")
+
+        directory = os.path.dirname(self.path)
+
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self.offsets = self.load() if resume else {}
+
+        if resume:
+            self.compact()
+
+        self.file = open(self.path, "a" if resume else "w", encoding="utf-8")
+
+    def lines(self):
+        """
+        Yields the byte offset, url and line of every valid entry in the
+        journal. A line cut short by a crash is skipped
+        """
+        try:
+            with open(self.path, "rb") as file:
+                offset = 0
+
+                for line in file:
+                    try:
+                        yield offset, json.loads(line)["url"], line
+
+                    except:pass
+
+                    offset += len(line)
+
+        except FileNotFoundError:
+            pass
+
+    def load(self) -> dict:
+        """
+        Finds the pages journaled by the last run
+
+        :return: a dictionary of url to the offset of the page's last entry
+        """
+        offsets = {url: offset for offset, url, _ in self.lines()}
+
+        self.logger.info(f"Pages found in journal: {len(offsets)}")
+
+        return offsets
+
+    def compact(self) -> None:
+        """Rewrites the journal with the last valid entry of every page"""
+        offsets = {}
+
+        with open(f"{self.path}.tmp", "wb") as file:
+            for offset, url, line in self.lines():
+                if self.offsets.get(url) == offset:
+                    offsets[url] = file.tell()
+                    file.write(line if line.endswith(b"\n") else line + b"\n")
+
+        os.replace(f"{self.path}.tmp", self.path)
+
+        self.offsets = offsets
+
+    def get(self, link:str) -> dict:
+        """
+        Reads the journaled records of a page
+
+        :param link: the link to the player's profile on Liquipedia
+
+        :return: the page's entry or None if it was not journaled
+        """
+        offset = self.offsets.get(link)
+
+        if offset is None:
+            return None
+
+        with open(self.path, "rb") as file:
+            file.seek(offset)
+
+            return json.loads(file.readline())
+
+    def record(self, link:str, profile:dict, history:list,
+               achievements:list) -> None:
+        """
+        Journals a finished page with its records
+
+        :param link: the link to the player's profile on Liquipedia
+        :param profile: the player's profile
+        :param history: the player's history rows
+        :param achievements: the player's achievement rows
+        """
+        entry = {
+            "url": link, "profile": profile,
+            "history": history, "achievements": achievements
+        }
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+
+        with self.lock:
+            self.file.write(line)
+            self.file.flush()
+
+    def close(self) -> None:
+        """Closes the journal"""
+        with self.lock:
+            self.file.close()
@@ -1,41 +1,100 @@
+import atexit
 import logging
 import os
 import sys
+import threading
+import time
 from datetime import date
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
 
 
 class Logger:
     if not os.path.exists("./logs/"):
         os.makedirs("./logs/")
 
-    def __init__(self, name:str) -> None:
+    # one queue and one writer thread per process, shared by all loggers
+    queue = None
+    listener = None
+    setup_lock = threading.Lock()
+
+    def __init__(self, name:str, progress_interval:float=5) -> None:
+        """
+        Logs through a queue to a single background thread that writes to
+        the console and the log file, so workers never wait on log writes
+
+        :param name: the name shown in every line
+        :param progress_interval: min seconds between two progress lines of
+        the same kind
+        """
+        self.setup()
+
         self.logger = logging.getLogger(name)
         self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False
+
+        if not self.logger.handlers:
+            self.logger.addHandler(QueueHandler(Logger.queue))
+
+        self.progress_interval = progress_interval
+        self.last_progress = {}
+
+    @classmethod
+    def setup(cls) -> None:
+        """Starts the writer thread of the process the first time only"""
+        with cls.setup_lock:
+            if cls.listener is not None:
+                return
+
+            stream_handler = logging.StreamHandler()
+            file_handler = logging.FileHandler(
+                f"./logs/odoo_logs_{date.today()}.log"
+            )
+
+            stream_handler.setLevel(logging.INFO)
+            file_handler.setLevel(logging.INFO)
 
-        stream_handler = logging.StreamHandler()
-        file_handler = logging.FileHandler(
-            f"./logs/odoo_logs_{date.today()}.log"
-        )
-        
-        stream_handler.setLevel(logging.INFO)
-        file_handler.setLevel(logging.INFO)
-        
-        logs_format = logging.Formatter(
-            "%(asctime)s:%(levelname)s:%(name)s:%(message)s"
-        )
+            logs_format = logging.Formatter(
+                "%(asctime)s:%(levelname)s:%(name)s:%(message)s"
+            )
 
-        stream_handler.setFormatter(logs_format)
-        file_handler.setFormatter(logs_format)
+            stream_handler.setFormatter(logs_format)
+            file_handler.setFormatter(logs_format)
 
-        self.logger.addHandler(stream_handler)
-        self.logger.addHandler(file_handler)
+            cls.queue = SimpleQueue()
+            cls.listener = QueueListener(
+                cls.queue, stream_handler, file_handler)
+            cls.listener.start()
+
+            atexit.register(cls.listener.stop)
 
     def info(self, message:str) -> None:
         self.logger.info(message)
 
+    def progress(self, message:str, key:str=None) -> None:
+        """
+        Logs a high frequency progress message, dropping it if the last one
+        of the same kind was logged less than the progress interval ago
+
+        :param message: the progress message
+        :param key: the kind of message. Defaults to the calling line, so
+        unrelated progress messages never drop each other
+        """
+        if key is None:
+            caller = sys._getframe(1)
+            key = f"{caller.f_code.co_filename}:{caller.f_lineno}"
+
+        now = time.monotonic()
+
+        if now - self.last_progress.get(key, 0.0) < self.progress_interval:
+            return
+
+        self.last_progress[key] = now
+        self.logger.info(message)
+
     def error(self, message:str) -> None:
         self.logger.error(message, exc_info=True)
         sys.exit(1)
 
     def warn(self, message:str) -> None:
-        self.logger.warning(message)
\ No newline at end of file
+        self.logger.warning(message)
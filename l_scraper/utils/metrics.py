@@ -0,0 +1,296 @@
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .logger import Logger
+
+# upper bounds in seconds of the latency histogram buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class Histogram:
+    def __init__(self) -> None:
+        """Counts observations into the latency buckets"""
+        self.counts = [0] * len(BUCKETS)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value:float) -> None:
+        """
+        Adds an observation
+
+        :param value: the observed latency in seconds
+        """
+        self.sum += value
+        self.count += 1
+
+        for index, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+
+    def cumulative(self) -> list:
+        """Returns the number of observations at or under every bucket"""
+        counts, total = [], 0
+
+        for count in self.counts:
+            total += count
+            counts.append(total)
+
+        return counts
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        """Answers with the metrics in prometheus text format"""
+        body = self.server.metrics.render().encode()
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format:str, *args) -> None:
+        """Keeps scrapes of the endpoint out of the log"""
+
+
+class Metrics:
+    def __init__(self, prefix:str="scraper") -> None:
+        """
+        Thread safe counters, gauges and latency histograms of a crawl,
+        served in prometheus text format and dumped as json
+
+        :param prefix: prepended to the name of every metric
+        """
+        self.prefix = prefix
+
+        self.counters = {}
+        self.histograms = {}
+        self.gauges = {}
+        self.lock = threading.Lock()
+
+        self.started = time.monotonic()
+        self.server = None
+        self.stopped = threading.Event()
+
+        self.logger = Logger("Metrics")
+
+    @staticmethod
+    def key(name:str, labels:dict) -> tuple:
+        """
+        Returns the key a metric with given labels is stored under
+
+        :param name: the metric name
+        :param labels: the metric labels
+        """
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name:str, value:float=1, **labels) -> None:
+        """
+        Increases a counter
+
+        :param name: the counter name
+        :param value: the amount to add
+        """
+        key = self.key(name, labels)
+
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name:str, value:float, **labels) -> None:
+        """
+        Adds a latency to a histogram
+
+        :param name: the histogram name
+        :param value: the latency in seconds
+        """
+        key = self.key(name, labels)
+
+        with self.lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram()
+
+            self.histograms[key].observe(value)
+
+    def gauge(self, name:str, callback, **labels) -> None:
+        """
+        Registers a gauge whose value is read when the metrics are collected
+
+        :param name: the gauge name
+        :param callback: returns the current value of the gauge
+        """
+        with self.lock:
+            self.gauges[self.key(name, labels)] = callback
+
+    def collect_gauges(self) -> dict:
+        """Reads the current value of every gauge"""
+        with self.lock:
+            gauges = dict(self.gauges)
+
+        values = {}
+
+        for key, callback in gauges.items():
+            try:
+                values[key] = callback()
+
+            except:pass
+
+        return values
+
+    def format_name(self, name:str, labels:tuple, suffix:str="",
+                    extra:tuple=()) -> str:
+        """
+        Formats a metric name with its labels the way prometheus expects
+
+        :param name: the metric name
+        :param labels: the metric labels
+        :param suffix: appended to the name, e.g. "_bucket"
+        :param extra: labels appended to the metric labels
+        """
+        pairs = ",".join(f'{label}="{value}"'
+                         for label, value in labels + extra)
+
+        name = f"{self.prefix}_{name}{suffix}"
+
+        return f"{name}{{{pairs}}}" if pairs else name
+
+    def render(self) -> str:
+        """Returns all the metrics in prometheus text format"""
+        gauges = self.collect_gauges()
+        lines, typed = [], set()
+
+        def declare(name:str, kind:str) -> None:
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {self.prefix}_{name} {kind}")
+
+        with self.lock:
+            for (name, labels), value in sorted(self.counters.items()):
+                declare(name, "counter")
+                lines.append(f"{self.format_name(name, labels)} {value}")
+
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                declare(name, "histogram")
+
+                bounds = list(zip(BUCKETS, histogram.cumulative()))
+                bounds.append(("+Inf", histogram.count))
+
+                for bound, count in bounds:
+                    bucket = self.format_name(
+                        name, labels, "_bucket", (("le", bound),))
+                    lines.append(f"{bucket} {count}")
+
+                lines.append(f"{self.format_name(name, labels, '_sum')} "
+                             f"{histogram.sum}")
+                lines.append(f"{self.format_name(name, labels, '_count')} "
+                             f"{histogram.count}")
+
+        for (name, labels), value in sorted(gauges.items()):
+            declare(name, "gauge")
+            lines.append(f"{self.format_name(name, labels)} {value}")
+
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> dict:
+        """
+        Returns all the metrics in a json friendly form. Counters also get
+        their average rate per second since the start of the run
+        """
+        gauges = self.collect_gauges()
+        elapsed = time.monotonic() - self.started
+        snapshot = {"elapsed": round(elapsed, 1), "counters": {},
+                    "histograms": {}, "gauges": {}}
+
+        with self.lock:
+            for key, value in self.counters.items():
+                snapshot["counters"][self.format_name(*key)] = {
+                    "total": value, "per_second": round(value / elapsed, 3)}
+
+            for key, histogram in self.histograms.items():
+                snapshot["histograms"][self.format_name(*key)] = {
+                    "count": histogram.count,
+                    "mean": round(histogram.sum / histogram.count, 4),
+                    "buckets": dict(zip(BUCKETS, histogram.cumulative()))}
+
+        for key, value in gauges.items():
+            snapshot["gauges"][self.format_name(*key)] = value
+
+        return snapshot
+
+    def dump(self, path:str) -> None:
+        """
+        Writes a snapshot of the metrics to a json file
+
+        :param path: the json file to write
+        """
+        directory = os.path.dirname(path)
+
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        with open(f"{path}.tmp", "w") as file:
+            json.dump(self.snapshot(), file, indent=4)
+
+        os.replace(f"{path}.tmp", path)
+
+    def serve(self, port:int) -> None:
+        """
+        Starts the metrics endpoint in the background
+
+        :param port: the port of the metrics endpoint
+        """
+        try:
+            self.server = ThreadingHTTPServer(("127.0.0.1", port),
+                                              MetricsHandler)
+
+        except OSError:
+            self.logger.warn(f"Port {port} is taken. Metrics are only "
+                             f"dumped to json")
+            return
+
+        self.server.daemon_threads = True
+        self.server.metrics = self
+
+        threading.Thread(
+            target=self.server.serve_forever, daemon=True).start()
+
+        self.logger.info(f"Metrics served on http://127.0.0.1:{port}/metrics")
+
+    def start(self, port:int, dump_path:str, interval:float) -> None:
+        """
+        Serves the metrics on a local port and dumps them to a json file
+        periodically, both in the background
+
+        :param port: the port of the metrics endpoint. 0 disables it. If the
+        port is taken, e.g. by another scraper, only the dumps are written
+        :param dump_path: the json file the metrics are dumped to
+        :param interval: seconds between dumps
+        """
+        if port:
+            self.serve(port)
+
+        def dump_periodically() -> None:
+            while not self.stopped.wait(interval):
+                try:
+                    self.dump(dump_path)
+
+                except:
+                    self.logger.warn("Could not dump metrics")
+
+        threading.Thread(target=dump_periodically, daemon=True).start()
+
+    def stop(self, dump_path:str) -> None:
+        """
+        Stops the endpoint and the periodic dumps and writes a last dump
+
+        :param dump_path: the json file the metrics are dumped to
+        """
+        self.stopped.set()
+
+        if self.server is not None:
+            self.server.shutdown()
+
+        self.dump(dump_path)
@@ -0,0 +1,68 @@
+import threading
+
+
+class Progress:
+    def __init__(self, total:int=0) -> None:
+        """
+        Tracks the progress of a crawl with a set of finished urls and named
+        counters. Every update is O(1) and holds the lock only for a set or
+        dict operation, unlike removing urls from a shared list
+
+        :param total: the number of urls to be crawled
+        """
+        self.total = total
+
+        self.done = set()
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.done)
+
+    @property
+    def remaining(self) -> int:
+        """The number of urls not finished yet"""
+        return self.total - len(self.done)
+
+    def add(self, count:int) -> None:
+        """
+        Raises the total when more urls are found during the crawl
+
+        :param count: the number of urls added
+        """
+        with self.lock:
+            self.total += count
+
+    def finish(self, url:str) -> bool:
+        """
+        Marks a url as finished
+
+        :param url: the crawled url
+
+        :return: False if the url had already been finished
+        """
+        with self.lock:
+            if url in self.done:
+                return False
+
+            self.done.add(url)
+
+            return True
+
+    def inc(self, name:str, value:int=1) -> None:
+        """
+        Increases a counter
+
+        :param name: the counter name, e.g. "images"
+        :param value: the amount to add
+        """
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def count(self, name:str) -> int:
+        """
+        Returns the value of a counter
+
+        :param name: the counter name
+        """
+        return self.counters.get(name, 0)
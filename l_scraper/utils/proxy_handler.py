@@ -1,32 +1,66 @@
-import threading
-from queue import Queue
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
-import requests
 from bs4 import BeautifulSoup
 
 from .logger import Logger
+from .proxy_pool import ProxyPool
+from .session_handler import SessionHandler
 
 
 class ProxyHandler:
-    def __init__(self) -> None:
-        self.ports = ["3128", "3124", "80", "8080"]
-        self.proxies = []
+    def __init__(self, session_handler:SessionHandler, 
+                 proxy_pool:ProxyPool, concurrency:int, store_path:str,
+                 ttl:int, base_url:str, proxy_list_url:str, 
+                 ports:list) -> None:
+        """
+        Finds working free proxies and adds them to the proxy pool
+
+        :param session_handler: pooled sessions shared with the scraper
+        :param proxy_pool: the pool working proxies are added to
+        :param concurrency: max number of proxies checked at once
+        :param store_path: the json file where working proxies are kept 
+        between runs
+        :param ttl: seconds for which a stored proxy is worth revalidating
+        :param base_url: the site proxies are validated against
+        :param proxy_list_url: the page the free proxies are listed on
+        :param ports: the ports tried on every listed proxy ip
+        """
+        self.store_path = store_path
+        self.ttl = ttl
+        self.stored = self.load_proxies()
+
+        self.base_url = base_url
+        self.proxy_list_url = proxy_list_url
+        self.ports = ports
+        self.proxies = proxy_pool
+        self.proxies.refill_callback = self.get_proxies
         
-        self.proxy_queue = Queue()
+        self.executor = ThreadPoolExecutor(max_workers=concurrency)
+        self.session_handler = session_handler
         
         self.logger = Logger("ProxyHandler")
 
-        self.create_ip_workers()
-
     def get_proxies(self) -> None:
-        """Fetches proxies from https://free-proxy-list.net/"""
-        self.logger.info("Fetching proxies...")
+        """
+        Fetches proxies from the free proxy list and returns as soon
+        as enough of them work. The rest keep being checked in the background
+        """
+        if self.stored:
+            self.logger.info(f"Revalidating stored proxies: {len(self.stored)}")
+            self.create_ip_jobs(list(self.stored))
+            self.stored = {}
+
+        if len(self.proxies.healthy()) < self.proxies.min_healthy:
+            self.logger.info("Fetching proxies...")
 
         proxies = set()
 
-        while len(self.proxies) < 10:
+        while len(self.proxies.healthy()) < self.proxies.min_healthy:
             try:
-                response = requests.get('https://free-proxy-list.net/')
+                response = self.session_handler.get(self.proxy_list_url)
                 proxies_table = BeautifulSoup(response.text, "html.parser")
 
                 if response.status_code != 200:
@@ -47,41 +81,82 @@ class ProxyHandler:
 
             self.logger.info("Filtering working proxies...")
             self.create_ip_jobs(list(proxies))
+            proxies.clear()
             
-        self.logger.info(f"Working proxies: {len(self.proxies)}. "
+        self.logger.info(f"Working proxies: {len(self.proxies.healthy())}. "
                           "Proceeding to scrape profiles...")
     
-    def create_ip_workers(self) -> None:
-        """Creates threads to check if a proxy is working"""
-        for _ in range(2000):
-            thread = threading.Thread(target=self.work_ip, daemon=True)
-            thread.start()
-        
+    def work_ip(self, ip_port:str) -> None:
+        """
+        Checks if a free proxy is working and adds it to the pool if it is
+
+        :param ip_port: ip:port of the proxy
+        """
+        try:
+            url = f"{self.base_url}/"
+
+            started = time.monotonic()
+            response = self.session_handler.get(
+                url, ip_port, rate_limited=False, verify=False, timeout=10)
+
+            if response.status_code == 200:
+                self.proxies.add(ip_port, time.monotonic() - started)
+                self.logger.progress(f"Proxies found: {len(self.proxies)}")
+            else:
+                self.session_handler.discard(ip_port)
+
+        except:
+            self.session_handler.discard(ip_port)
+    
+    def create_ip_jobs(self, proxies:list) -> None:
+        """
+        Submits proxy checks to the bounded pool of checker threads and waits
+        until enough proxies work or all of them have been checked
 
-    def work_ip(self) -> None:
-        """Checks if a free proxy is working"""
-        while True:
-            ip_port, proxies = self.proxy_queue.get()
-            try:
-                url = "https://liquipedia.net/"
-                proxy = {"https":f"http://{ip_port}"}
-                proxies.remove(ip_port)
+        :param proxies: ip:port of the proxies to check
+        """
+        known = set(self.proxies.healthy())
 
-                response = requests.get(
-                    url, proxies=proxy, verify=False, timeout=10)
+        pending = {self.executor.submit(self.work_ip, proxy) 
+                   for proxy in proxies if proxy not in known}
 
-                if response.status_code == 200:
-                    self.proxies.append(f"{ip_port}")
+        while pending and (
+            len(self.proxies.healthy()) < self.proxies.min_healthy):
+            _, pending = wait(pending, return_when=FIRST_COMPLETED)
 
-                self.logger.info(f"Proxies found: {len(self.proxies)}")
+    def load_proxies(self) -> dict:
+        """Loads the stored proxies that were seen working within the ttl"""
+        try:
+            with open(self.store_path, "r") as file:
+                stored = json.load(file)
 
-            except:pass
+        except:
+            return {}
 
-            self.proxy_queue.task_done()
-    
-    def create_ip_jobs(self, proxies:list) -> None:
-        """Create ip thread jobs"""
-        [self.proxy_queue.put((proxy, proxies)) for proxy in proxies]
-        self.proxy_queue.join()
+        now = time.time()
+
+        return {proxy: health for proxy, health in stored.items()
+                if now - health["last_seen"] < self.ttl}
+
+    def save_proxies(self) -> None:
+        """Stores the working proxies with their health for the next runs"""
+        proxies = self.load_proxies()
+        proxies.update(self.proxies.snapshot())
+
+        directory = os.path.dirname(self.store_path)
+
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        with open(f"{self.store_path}.tmp", "w") as file:
+            json.dump(proxies, file)
+
+        os.replace(f"{self.store_path}.tmp", self.store_path)
 
-        self.proxies = list(set(self.proxies))
+    def close(self) -> None:
+        """
+        Cancels the proxy checks that have not started yet and stores the
+        working proxies
+        """
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.save_proxies()
@@ -0,0 +1,264 @@
+import asyncio
+import random
+import threading
+import time
+
+from .logger import Logger
+
+# status codes that mean the proxy, not the page, is the problem
+PROXY_ERRORS = {403, 407, 429, 500, 502, 503, 504}
+
+# seconds after which a trial request that never reported back is given up
+TRIAL_TIMEOUT = 60
+
+
+class ProxyStats:
+    def __init__(self, latency:float) -> None:
+        """
+        Health of a single proxy
+
+        :param latency: the latency measured when the proxy was validated
+        """
+        self.success_rate = 1.0
+        self.latency = latency
+        self.failures = 0
+        self.trips = 0
+        self.quarantined_until = 0.0
+        self.trial_until = 0.0
+        self.succeeded = False
+        self.last_seen = time.time()
+
+    @property
+    def half_open(self) -> bool:
+        """Whether the proxy is out of quarantine but has not succeeded yet"""
+        return self.trips > 0 and self.quarantined_until <= time.monotonic()
+
+    @property
+    def weight(self) -> float:
+        """Fast proxies that rarely fail get picked more often"""
+        return self.success_rate / max(self.latency, 0.05)
+
+
+class ProxyPool:
+    def __init__(self, min_healthy:int=10, decay:float=0.3,
+                 max_failures:int=3, cooldown:float=30,
+                 max_trips:int=5) -> None:
+        """
+        A thread safe pool of proxies that tracks the success rate and latency
+        of every proxy with decaying averages, picks fast proxies more often
+        and quarantines failing ones
+
+        :param min_healthy: refill the pool when fewer proxies are healthy
+        :param decay: weight of the newest sample in the decaying averages
+        :param max_failures: consecutive failures that quarantine a proxy
+        :param cooldown: seconds a proxy stays in quarantine the first time.
+        Doubles every time the proxy fails its trial request after a
+        quarantine
+        :param max_trips: quarantines after which a proxy is dropped
+        """
+        self.min_healthy = min_healthy
+        self.decay = decay
+        self.max_failures = max_failures
+        self.cooldown = cooldown
+        self.max_trips = max_trips
+
+        self.stats = {}
+        self.condition = threading.Condition()
+
+        self.refill_callback = None
+        self.refilling = False
+
+        self.logger = Logger("ProxyPool")
+
+    def __len__(self) -> int:
+        return len(self.stats)
+
+    def add(self, proxy:str, latency:float=1.0) -> None:
+        """
+        Adds a working proxy to the pool
+
+        :param proxy: ip:port of the proxy
+        :param latency: the latency measured when the proxy was validated
+        """
+        with self.condition:
+            if proxy not in self.stats:
+                self.stats[proxy] = ProxyStats(latency)
+                self.condition.notify_all()
+
+    def healthy(self) -> list:
+        """Returns the proxies that are not quarantined"""
+        now = time.monotonic()
+
+        with self.condition:
+            return [proxy for proxy, stats in self.stats.items()
+                    if stats.quarantined_until <= now]
+
+    def is_healthy(self, proxy:str) -> bool:
+        """
+        Tells whether a proxy has worked in this crawl and has not failed
+        since, so that its errors can be blamed on the site
+
+        :param proxy: ip:port of the proxy
+        """
+        with self.condition:
+            stats = self.stats.get(proxy)
+
+            return (stats is not None and stats.succeeded 
+                    and stats.failures == 0 and stats.trips == 0)
+
+    def snapshot(self) -> dict:
+        """Returns the health of every proxy in a json friendly form"""
+        with self.condition:
+            return {
+                proxy: {
+                    "success_rate": stats.success_rate,
+                    "latency": stats.latency,
+                    "last_seen": stats.last_seen
+                }
+                for proxy, stats in self.stats.items()
+            }
+
+    def pick(self) -> tuple:
+        """
+        Picks a proxy, weighted towards fast and reliable ones. Quarantined
+        proxies whose cooldown is over get one trial request at a time until
+        a request through them succeeds. Must be called with the lock held
+
+        :return: the proxy, or None and the seconds until one may be free
+        (None if only a refill can help)
+        """
+        if not self.stats:
+            self.start_refill()
+            return None, None
+
+        now = time.monotonic()
+        proxies, weights = [], []
+
+        for proxy, stats in self.stats.items():
+            if stats.quarantined_until <= now and stats.trial_until <= now:
+                proxies.append(proxy)
+                weights.append(stats.weight)
+
+        if len(proxies) < self.min_healthy:
+            self.start_refill()
+
+        if not proxies:
+            return None, min(max(stats.quarantined_until, stats.trial_until)
+                             for stats in self.stats.values()) - now
+
+        proxy = random.choices(proxies, weights)[0]
+        stats = self.stats[proxy]
+
+        if stats.half_open:
+            stats.trial_until = now + TRIAL_TIMEOUT
+
+        return proxy, 0.0
+
+    def choose(self) -> str:
+        """
+        Picks a proxy. Waits while every proxy is quarantined or on trial,
+        until a cooldown ends, a trial reports back or a refill adds proxies
+        """
+        with self.condition:
+            while True:
+                proxy, wait = self.pick()
+
+                if proxy is not None:
+                    return proxy
+
+                self.condition.wait(wait)
+
+    async def choose_async(self) -> str:
+        """
+        Picks a proxy without blocking the event loop. Waits like choose,
+        checking again at least every second
+        """
+        while True:
+            with self.condition:
+                proxy, wait = self.pick()
+
+            if proxy is not None:
+                return proxy
+
+            await asyncio.sleep(min(wait or 1.0, 1.0))
+
+    def report(self, proxy:str, success:bool, latency:float) -> None:
+        """
+        Records the outcome of a request made through a proxy
+
+        :param proxy: ip:port of the proxy
+        :param success: whether the proxy returned a usable response
+        :param latency: the time the request took in seconds
+        """
+        with self.condition:
+            stats = self.stats.get(proxy)
+
+            if stats is None:
+                return
+
+            stats.success_rate += self.decay * (success - stats.success_rate)
+
+            # requests sent before the quarantine do not count against it
+            if stats.quarantined_until > time.monotonic():
+                return
+
+            if not success:
+                stats.failures += 1
+
+                # a failed trial opens the circuit again right away
+                if stats.half_open or stats.failures >= self.max_failures:
+                    self.quarantine(proxy, stats)
+
+                return
+
+            stats.latency += self.decay * (latency - stats.latency)
+            if stats.trial_until:
+                stats.trial_until = 0.0
+                self.condition.notify_all()
+
+            stats.failures, stats.trips = 0, 0
+            stats.succeeded = True
+            stats.last_seen = time.time()
+
+    def quarantine(self, proxy:str, stats:ProxyStats) -> None:
+        """
+        Opens the circuit of a failing proxy. Must be called with the lock held
+
+        :param proxy: ip:port of the proxy
+        :param stats: the proxy's health
+        """
+        stats.trips += 1
+        stats.failures = 0
+        stats.trial_until = 0.0
+
+        if stats.trips > self.max_trips:
+            del self.stats[proxy]
+        else:
+            stats.quarantined_until = (
+                time.monotonic() + self.cooldown * 2 ** (stats.trips - 1))
+
+        # waiting pickers work out the next wake up time again
+        self.condition.notify_all()
+
+    def start_refill(self) -> None:
+        """
+        Starts fetching new proxies in the background. Must be called with the
+        lock held
+        """
+        if self.refilling or self.refill_callback is None:
+            return
+
+        self.refilling = True
+        self.logger.info("Healthy proxies running low. Refilling...")
+
+        threading.Thread(target=self.refill, daemon=True).start()
+
+    def refill(self) -> None:
+        """Calls the refill callback and allows the next refill"""
+        try:
+            self.refill_callback()
+
+        finally:
+            with self.condition:
+                self.refilling = False
+                self.condition.notify_all()
@@ -0,0 +1,248 @@
+import asyncio
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import parse_qs, urlparse
+
+from .logger import Logger
+
+# status codes that mean the server wants us to slow down
+THROTTLE_STATUSES = {429, 503}
+
+
+class TokenBucket:
+    def __init__(self, rate:float) -> None:
+        """
+        A token bucket whose rate can be lowered when the server throttles
+        and slowly climbs back to its configured value
+
+        :param rate: the number of requests per second allowed
+        """
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = rate / 20
+
+        # at least one request can always go out right away, even for
+        # budgets of less than one request per second
+        self.capacity = max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def refill(self, now:float) -> None:
+        """
+        Adds the tokens earned since the last update
+
+        :param now: the current monotonic time
+        """
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, now:float) -> float:
+        """
+        Takes a token and returns how long to wait before using it
+
+        :param now: the current monotonic time
+        """
+        self.refill(now)
+        self.tokens -= 1
+
+        return max(0.0, -self.tokens / self.rate)
+
+    def throttle(self, now:float, pause:float) -> None:
+        """
+        Halves the rate and holds back the next requests for a given time
+
+        :param now: the current monotonic time
+        :param pause: the seconds to hold back requests
+        """
+        self.refill(now)
+        self.rate = max(self.min_rate, self.rate / 2)
+        self.tokens = min(self.tokens, -pause * self.rate)
+        self.paused_until = max(self.paused_until, now + pause)
+
+    def recover(self) -> None:
+        """Raises the rate a little after a request went through"""
+        self.rate = min(self.max_rate, self.rate + self.max_rate / 100)
+
+
+class RateLimiter:
+    def __init__(self, host:str, global_rate:float, pages_rate:float,
+                 images_rate:float, api_rate:float, parse_rate:float) -> None:
+        """
+        Limits the requests sent to a host with a global budget plus separate
+        budgets for wiki pages, images and the MediaWiki api. Shared by all
+        workers
+
+        :param host: requests to this host and its subdomains are limited
+        :param global_rate: requests per second allowed in total
+        :param pages_rate: requests per second allowed for wiki pages
+        :param images_rate: requests per second allowed for images
+        :param api_rate: requests per second allowed for api calls, far less
+        than for pages under the wiki's api terms
+        :param parse_rate: requests per second allowed for action=parse api
+        calls, which the wiki limits even more
+        """
+        self.host = host
+
+        self.buckets = {
+            "global": TokenBucket(global_rate),
+            "pages": TokenBucket(pages_rate),
+            "images": TokenBucket(images_rate),
+            "api": TokenBucket(api_rate),
+            "parse": TokenBucket(parse_rate)
+        }
+        self.lock = threading.Lock()
+
+        self.logger = Logger("RateLimiter")
+
+    def get_budget(self, url:str) -> str:
+        """
+        Returns the budget a url is counted against, or None if the url is not
+        rate limited
+
+        :param url: the url to be requested
+        """
+        parsed = urlparse(url)
+        hostname = parsed.hostname or ""
+
+        if hostname != self.host and not hostname.endswith(f".{self.host}"):
+            return None
+
+        if parsed.path.endswith("/api.php"):
+            action = parse_qs(parsed.query).get("action", [""])[0]
+
+            return "parse" if action == "parse" else "api"
+
+        return "images" if "/images/" in parsed.path else "pages"
+
+    def reserve(self, url:str) -> float:
+        """
+        Takes a token from the global and the url's budget and returns how
+        long to wait before sending the request
+
+        :param url: the url to be requested
+        """
+        budget = self.get_budget(url)
+
+        if budget is None:
+            return 0.0
+
+        now = time.monotonic()
+
+        with self.lock:
+            return max(self.buckets["global"].reserve(now),
+                       self.buckets[budget].reserve(now))
+
+    def paused(self, url:str) -> bool:
+        """
+        Tells whether the budgets of a url are held back by a throttle
+
+        :param url: the url to be requested
+        """
+        budget = self.get_budget(url)
+
+        if budget is None:
+            return False
+
+        now = time.monotonic()
+
+        with self.lock:
+            return (self.buckets["global"].paused_until > now
+                    or self.buckets[budget].paused_until > now)
+
+    def wait(self, url:str) -> None:
+        """
+        Blocks until a request to a given url may be sent. A throttle that
+        came in while waiting voids the reservation, and a new one is taken
+        on the lowered rate
+
+        :param url: the url to be requested
+        """
+        while True:
+            delay = self.reserve(url)
+
+            if delay:
+                time.sleep(delay)
+
+            if not self.paused(url):
+                return
+
+    async def wait_async(self, url:str) -> None:
+        """
+        Waits on the event loop until a request to a given url may be sent.
+        A throttle that came in while waiting voids the reservation, and a
+        new one is taken on the lowered rate
+
+        :param url: the url to be requested
+        """
+        while True:
+            delay = self.reserve(url)
+
+            if delay:
+                await asyncio.sleep(delay)
+
+            if not self.paused(url):
+                return
+
+    @staticmethod
+    def retry_after(headers:dict) -> float:
+        """
+        Reads the Retry-After header in seconds, defaulting to 5 seconds
+
+        :param headers: the response headers
+        """
+        value = headers.get("Retry-After") if headers else None
+
+        try:
+            return float(value)
+
+        except (TypeError, ValueError):
+            pass
+
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp()
+                       - time.time())
+
+        except (TypeError, ValueError):
+            return 5.0
+
+    def feedback(self, url:str, status:int, headers:dict, 
+                 trusted:bool=True) -> None:
+        """
+        Slows down when the server throttles and speeds back up otherwise.
+        A 429 or 503 without Retry-After through a proxy that is not known to
+        work is most likely the proxy's own error and is left to the proxy
+        pool
+
+        :param url: the requested url
+        :param status: the response status code
+        :param headers: the response headers
+        :param trusted: whether the response came on a direct connection or
+        through a healthy proxy
+        """
+        budget = self.get_budget(url)
+
+        if budget is None:
+            return
+
+        if (status in THROTTLE_STATUSES and not trusted
+            and not (headers and headers.get("Retry-After"))):
+            return
+
+        buckets = (self.buckets["global"], self.buckets[budget])
+
+        with self.lock:
+            if status in THROTTLE_STATUSES:
+                pause = self.retry_after(headers)
+
+                for bucket in buckets:
+                    bucket.throttle(time.monotonic(), pause)
+
+                self.logger.warn(f"Throttled with {status}. Pausing {budget} "
+                                 f"for {pause:.1f}s at "
+                                 f"{buckets[1].rate:.2f} requests/s")
+            else:
+                for bucket in buckets:
+                    bucket.recover()
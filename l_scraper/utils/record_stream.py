@@ -0,0 +1,153 @@
+import csv
+import json
+import os
+import shutil
+import threading
+
+
+class RecordStream:
+    def __init__(self, path:str, file_format:str, batch_size:int) -> None:
+        """
+        A list-like sink that writes records to disk in batches as they are
+        appended, so that only the current batch is kept in memory
+
+        :param path: the file the records are written to
+        :param file_format: "jsonl" or "csv"
+        :param batch_size: the number of records buffered before a write
+        """
+        self.path = path
+        self.file_format = file_format
+        self.batch_size = batch_size
+
+        self.buffer, self.columns = [], []
+        self.count, self.written = 0, 0
+
+        self.lock = threading.Lock()
+
+        # a new file rather than a truncated one, so that snapshots of the
+        # last run's file keep their content
+        open(f"{self.path}.tmp", "w").close()
+        os.replace(f"{self.path}.tmp", self.path)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __iter__(self):
+        self.flush()
+
+        return self.read()
+
+    def append(self, record:dict) -> int:
+        """
+        Adds a record to the stream, writing the batch once it is full
+
+        :param record: a dictionary of column to value
+
+        :return: the index of the record in the stream
+        """
+        return self.extend([record])
+
+    def extend(self, records:list) -> int:
+        """
+        Adds several records to the stream next to each other
+
+        :param records: a list of dictionaries of column to value
+
+        :return: the index of the first record in the stream
+        """
+        with self.lock:
+            start = self.count
+
+            self.buffer.extend(records)
+            self.count += len(records)
+
+            if len(self.buffer) >= self.batch_size:
+                self.write_batch()
+
+            return start
+
+    def flush(self) -> None:
+        """Writes the records that are still buffered"""
+        with self.lock:
+            self.write_batch()
+
+    def write_batch(self) -> None:
+        """Writes the buffered records. Must be called with the lock held"""
+        if not self.buffer:
+            return
+
+        new_columns = False
+
+        for record in self.buffer:
+            for column in record:
+                if column not in self.columns:
+                    self.columns.append(column)
+                    new_columns = True
+
+        if self.file_format == "csv":
+            if new_columns and self.written:
+                self.rewrite_header()
+
+            with open(self.path, "a", newline="", encoding="utf-8") as file:
+                writer = csv.DictWriter(file, self.columns, restval="")
+
+                if not self.written:
+                    writer.writeheader()
+
+                writer.writerows(self.buffer)
+        else:
+            with open(self.path, "a", encoding="utf-8") as file:
+                for record in self.buffer:
+                    file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+        self.written += len(self.buffer)
+        self.buffer = []
+
+    def rewrite_header(self) -> None:
+        """
+        Rewrites the csv file with the current column set when new columns
+        show up after rows have been written
+        """
+        with open(self.path, "r", newline="", encoding="utf-8") as source, \
+             open(f"{self.path}.tmp", "w", newline="",
+                  encoding="utf-8") as target:
+            writer = csv.DictWriter(target, self.columns, restval="")
+            writer.writeheader()
+            writer.writerows(csv.DictReader(source))
+
+        os.replace(f"{self.path}.tmp", self.path)
+
+    def snapshot(self, path:str) -> None:
+        """
+        Keeps the records written so far under another path, as a hard link
+        where the file system allows it
+
+        :param path: where the snapshot is kept
+        """
+        self.flush()
+
+        try:
+            os.link(self.path, path)
+
+        except OSError:
+            shutil.copyfile(self.path, path)
+
+    def read(self):
+        """Yields the records written so far"""
+        return self.read_file(self.path, self.file_format)
+
+    @staticmethod
+    def read_file(path:str, file_format:str):
+        """
+        Yields the records of a stream file
+
+        :param path: the file the records were written to
+        :param file_format: "jsonl" or "csv"
+        """
+        with open(path, "r", newline="", encoding="utf-8") as file:
+            if file_format == "csv":
+                for row in csv.DictReader(file):
+                    yield {key: value for key, value in row.items() if value}
+            else:
+                for line in file:
+                    yield json.loads(line)
@@ -0,0 +1,178 @@
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+from datetime import datetime
+
+from .logger import Logger
+from .metrics import Metrics
+
+
+class RetryPolicy:
+    def __init__(self, max_attempts:int, base_delay:float, max_delay:float,
+                 deadline:float, dead_letter_path:str,
+                 metrics:Metrics=None) -> None:
+        """
+        Bounds the retries of a url with exponential backoff, jitter and a
+        deadline. Urls that run out of retries are written to a dead-letter
+        file for a later pass
+
+        :param max_attempts: max number of attempts per url
+        :param base_delay: seconds to wait before the second attempt
+        :param max_delay: upper bound of the wait between attempts
+        :param deadline: seconds after which a url is given up
+        :param dead_letter_path: the jsonl file of given up urls
+        :param metrics: where the retries and given up urls are counted
+        """
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.dead_letter_path = dead_letter_path
+        self.metrics = metrics
+
+        self.lock = threading.Lock()
+
+        directory = os.path.dirname(self.dead_letter_path)
+
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self.logger = Logger("RetryPolicy")
+
+    def backoff(self, attempt:int) -> float:
+        """
+        Returns a random wait before a given attempt ("full jitter")
+
+        :param attempt: the number of attempts made so far
+        """
+        return random.uniform(
+            0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+    def attempts(self):
+        """
+        Yields the attempt numbers, sleeping between attempts. Stops once the
+        attempts or the deadline run out
+        """
+        started = time.monotonic()
+
+        for attempt in range(self.max_attempts):
+            if attempt:
+                delay = self.backoff(attempt)
+
+                if time.monotonic() - started + delay > self.deadline:
+                    return
+
+                self.count("retries_total")
+                time.sleep(delay)
+
+            yield attempt
+
+    async def attempts_async(self):
+        """
+        Yields the attempt numbers, sleeping on the event loop between
+        attempts. Stops once the attempts or the deadline run out
+        """
+        started = time.monotonic()
+
+        for attempt in range(self.max_attempts):
+            if attempt:
+                delay = self.backoff(attempt)
+
+                if time.monotonic() - started + delay > self.deadline:
+                    return
+
+                self.count("retries_total")
+                await asyncio.sleep(delay)
+
+            yield attempt
+
+    def count(self, name:str, **labels) -> None:
+        """
+        Increases a counter if the metrics are collected
+
+        :param name: the counter name
+        """
+        if self.metrics is not None:
+            self.metrics.inc(name, **labels)
+
+    def dead_letter(self, kind:str, url:str, reason:str) -> None:
+        """
+        Writes a url that ran out of retries to the dead-letter file
+
+        :param kind: what the url points to, e.g. "page" or "image"
+        :param url: the url given up
+        :param reason: why the url was given up
+        """
+        self.logger.warn(f"Giving up on {kind} >>> {url}: {reason}")
+        self.count("dead_letters_total", kind=kind)
+
+        entry = {
+            "kind": kind, "url": url, "reason": reason,
+            "time": datetime.now().isoformat(timespec="seconds")
+        }
+
+        with self.lock:
+            with open(self.dead_letter_path, "a", encoding="utf-8") as file:
+                file.write(json.dumps(entry) + "\n")
+
+    def read_entries(self) -> list:
+        """
+        Reads the entries of the dead-letter file as (entry, line) pairs. Must
+        be called with the lock held
+        """
+        entries = []
+
+        try:
+            with open(self.dead_letter_path, "r", encoding="utf-8") as file:
+                for line in file:
+                    try:
+                        entries.append((json.loads(line), line))
+
+                    except:pass
+
+        except FileNotFoundError:
+            pass
+
+        return entries
+
+    def read_dead_letters(self, kind:str) -> list:
+        """
+        Returns the dead-lettered urls of a given kind to be retried. They
+        stay in the dead-letter file until settle_dead_letters, so a retry
+        pass that stops early can be run again
+
+        :param kind: what the urls point to, e.g. "page" or "image"
+        """
+        with self.lock:
+            entries = self.read_entries()
+
+        return list(dict.fromkeys(
+            entry["url"] for entry, _ in entries if entry["kind"] == kind))
+
+    def settle_dead_letters(self, kind:str, resolved:set) -> None:
+        """
+        Removes the urls of a given kind that were saved by a retry pass from
+        the dead-letter file. The urls that failed again keep their latest
+        entry only
+
+        :param kind: what the urls point to, e.g. "page" or "image"
+        :param resolved: the urls saved by the retry pass
+        """
+        with self.lock:
+            entries = self.read_entries()
+            latest = {entry["url"]: line for entry, line in entries
+                      if entry["kind"] == kind}
+
+            with open(f"{self.dead_letter_path}.tmp", "w", 
+                      encoding="utf-8") as file:
+                for entry, line in entries:
+                    if entry["kind"] != kind:
+                        file.write(line)
+                    elif (entry["url"] not in resolved 
+                          and latest[entry["url"]] is line):
+                        file.write(line)
+
+            os.replace(f"{self.dead_letter_path}.tmp", self.dead_letter_path)
@@ -0,0 +1,310 @@
+import json
+import os
+from datetime import datetime
+from urllib.parse import unquote, urlparse
+
+from .logger import Logger
+from .proxy_pool import ProxyPool
+from .record_stream import RecordStream
+from .retry_policy import RetryPolicy
+from .session_handler import SessionHandler
+
+BATCH_SIZE = 50
+
+
+class RevisionHandler:
+    def __init__(self, state_path:str, session_handler:SessionHandler,
+                 proxies:ProxyPool, retry_policy:RetryPolicy) -> None:
+        """
+        Checks the latest revision of every input page against the revisions
+        recorded on the last run so that only changed pages are crawled again.
+        The state keeps the revision of every page and where its records are
+        in a snapshot of the output streams; the records of unchanged pages
+        are copied forward from the snapshot at the end of the run
+
+        :param state_path: the json file where revisions and record offsets
+        are kept
+        :param session_handler: pooled sessions shared with the scraper
+        :param proxies: the pool of working proxies
+        :param retry_policy: bounds the retries of every api call
+        """
+        self.state_path = state_path
+        self.session_handler = session_handler
+        self.proxies = proxies
+        self.retry_policy = retry_policy
+
+        self.revisions = {}
+        self.offsets = {}
+        self.unchanged = []
+
+        state = self.load_state()
+        self.pages = state.get("pages", {})
+        self.snapshots = {
+            snapshot_id: snapshot 
+            for snapshot_id, snapshot in state.get("snapshots", {}).items()
+            if all(os.path.isfile(source["path"]) 
+                   for source in snapshot.values())}
+
+        self.logger = Logger("RevisionHandler")
+
+    def load_state(self) -> dict:
+        """Loads the revisions and record offsets saved on the last run"""
+        try:
+            with open(self.state_path, "r") as file:
+                return json.load(file)
+
+        except:
+            return {}
+
+    @staticmethod
+    def split_link(link:str) -> tuple:
+        """
+        Splits a profile link into the wiki's api url and the page title
+
+        :param link: the link to the player's profile on Liquipedia
+        """
+        url = urlparse(link)
+        wiki, _, title = url.path.strip("/").partition("/")
+        api_url = f"{url.scheme}://{url.netloc}/{wiki}/api.php"
+
+        return api_url, unquote(title).replace("_", " ")
+
+    def request_revisions(self, api_url:str, titles:list) -> dict:
+        """
+        Requests the latest revision id of up to 50 titles in one api call
+
+        :param api_url: the MediaWiki api url of the wiki
+        :param titles: the page titles
+
+        :return: a dictionary of requested title to revision id, or None if
+        the page does not exist or the api call was given up
+        """
+        params = {
+            "action": "query", "prop": "revisions", "rvprop": "ids",
+            "titles": "|".join(titles), "redirects": 1, "format": "json",
+            "formatversion": 2
+        }
+
+        query = None
+
+        for _ in self.retry_policy.attempts():
+            try:
+                proxy = self.proxies.choose()
+                response = self.session_handler.get(
+                    api_url, proxy, params=params, timeout=15)
+
+                if response.status_code == 200:
+                    query = response.json()["query"]
+                    break
+
+            except:pass
+
+        if query is None:
+            self.retry_policy.dead_letter(
+                "revisions", api_url, f"could not check {len(titles)} titles")
+
+            return {title: None for title in titles}
+
+        normalized = {
+            item["from"]: item["to"] for item in query.get("normalized", [])}
+        redirects = {
+            item["from"]: item["to"] for item in query.get("redirects", [])}
+        revisions = {
+            page["title"]: page["revisions"][0]["revid"]
+            for page in query.get("pages", []) if page.get("revisions")}
+
+        revision_ids = {}
+
+        for title in titles:
+            page_title = normalized.get(title, title)
+            page_title = redirects.get(page_title, page_title)
+
+            revision_ids[title] = revisions.get(page_title)
+
+        return revision_ids
+
+    def fetch_revisions(self, links:list) -> None:
+        """
+        Fetches the latest revision id of every link, 50 titles per call
+
+        :param links: links to the players' profiles on Liquipedia
+        """
+        wikis, fetched = {}, 0
+
+        for link in links:
+            api_url, title = self.split_link(link)
+            wikis.setdefault(api_url, {})[title] = link
+
+        for api_url, titles in wikis.items():
+            titles_list = list(titles)
+
+            for index in range(0, len(titles_list), BATCH_SIZE):
+                batch = titles_list[index:index + BATCH_SIZE]
+
+                for title, revid in self.request_revisions(
+                    api_url, batch).items():
+                    self.revisions[titles[title]] = revid
+
+                fetched += len(batch)
+
+            self.logger.info(f"Revisions fetched: {fetched}/{len(links)}")
+
+    def filter_changed(self, links:list) -> list:
+        """
+        Returns the links whose page changed since the last run. The records
+        of the unchanged pages are copied forward by carry_forward
+
+        :param links: links to the players' profiles on Liquipedia
+        """
+        self.fetch_revisions(links)
+
+        changed = []
+
+        for link in links:
+            previous = self.pages.get(link)
+            revid = self.revisions.get(link)
+
+            if (previous and revid and previous["revid"] == revid
+                and previous["snapshot"] in self.snapshots):
+                self.unchanged.append(link)
+            else:
+                changed.append(link)
+
+        self.logger.info(f"Changed or new pages: {len(changed)} | "
+                         f"Unchanged: {len(links) - len(changed)}")
+
+        return changed
+
+    def record_offsets(self, link:str, offsets:dict) -> None:
+        """
+        Records where the records of a page were written in this run
+
+        :param link: the link to the player's profile on Liquipedia
+        :param offsets: a dictionary of stream name to the index of the first
+        record and the number of records
+        """
+        self.offsets[link] = offsets
+
+    def carry_forward(self, streams:dict) -> None:
+        """
+        Copies the records of the unchanged pages from the snapshots into the
+        output streams, reading every snapshot once from start to end
+
+        :param streams: a dictionary of stream name, e.g. "history", to the
+        stream of this run
+        """
+        snapshot_links = {}
+
+        for link in self.unchanged:
+            snapshot_links.setdefault(
+                self.pages[link]["snapshot"], []).append(link)
+
+        for snapshot_id, links in snapshot_links.items():
+            for kind, stream in streams.items():
+                self.copy_records(
+                    self.snapshots[snapshot_id][kind], links, kind, stream)
+
+        self.logger.info(f"Unchanged pages carried forward: "
+                         f"{len(self.unchanged)}")
+
+    def copy_records(self, source:dict, links:list, kind:str,
+                     stream:RecordStream) -> None:
+        """
+        Copies the records of some pages from one snapshot file into a stream,
+        one page at a time so that the records of a page stay together
+
+        :param source: the path and format of the snapshot file
+        :param links: the links of the pages to copy
+        :param kind: the stream name
+        :param stream: the stream of this run
+        """
+        pending = []
+
+        for link in links:
+            start, count = self.pages[link][kind]
+
+            if count:
+                pending.append((start, count, link))
+            else:
+                self.offsets.setdefault(link, {})[kind] = [len(stream), 0]
+
+        if not pending:
+            return
+
+        pending.sort()
+        position, records = 0, []
+
+        for index, record in enumerate(
+            RecordStream.read_file(source["path"], source["format"])):
+            start, count, link = pending[position]
+
+            if index < start:
+                continue
+
+            records.append(record)
+
+            if len(records) == count:
+                self.offsets.setdefault(link, {})[kind] = [
+                    stream.extend(records), count]
+
+                position, records = position + 1, []
+
+                if position == len(pending):
+                    break
+
+    def save_state(self, streams:dict, merge:bool=False) -> None:
+        """
+        Snapshots the output streams and saves the revision and record
+        offsets of every page for the next run. Snapshots no page points to
+        any more are deleted
+
+        :param streams: a dictionary of stream name to the stream of this run
+        :param merge: whether to keep the pages of earlier runs that were not
+        crawled in this one, e.g. in a dead-letter pass
+        """
+        directory = os.path.dirname(self.state_path)
+
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        snapshot_id = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        base_path = os.path.splitext(self.state_path)[0]
+        snapshot = {}
+
+        for kind, stream in streams.items():
+            path = f"{base_path}_{snapshot_id}_{kind}.{stream.file_format}"
+
+            stream.snapshot(path)
+            snapshot[kind] = {"path": path, "format": stream.file_format}
+
+        pages = dict(self.pages) if merge else {}
+
+        for link, offsets in self.offsets.items():
+            if self.revisions.get(link) and len(offsets) == len(streams):
+                pages[link] = dict(
+                    offsets, revid=self.revisions[link], snapshot=snapshot_id)
+
+        snapshots = dict(self.snapshots, **{snapshot_id: snapshot})
+        used = {page["snapshot"] for page in pages.values()}
+
+        state = {
+            "snapshots": {snapshot_id: snapshot 
+                          for snapshot_id, snapshot in snapshots.items()
+                          if snapshot_id in used},
+            "pages": pages
+        }
+
+        with open(f"{self.state_path}.tmp", "w") as file:
+            json.dump(state, file)
+
+        os.replace(f"{self.state_path}.tmp", self.state_path)
+
+        for snapshot_id, snapshot in snapshots.items():
+            if snapshot_id not in used:
+                for source in snapshot.values():
+                    try:
+                        os.remove(source["path"])
+
+                    except OSError:pass
+
+        self.logger.info(f"Revisions saved >> {self.state_path}")
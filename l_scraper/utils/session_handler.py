@@ -0,0 +1,160 @@
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .metrics import Metrics
+from .proxy_pool import PROXY_ERRORS, ProxyPool
+from .rate_limiter import RateLimiter
+
+
+class SessionHandler:
+    def __init__(self, pool_size:int, headers:dict=None,
+                 proxy_pool:ProxyPool=None,
+                 rate_limiter:RateLimiter=None,
+                 metrics:Metrics=None) -> None:
+        """
+        Keeps one keep-alive session per proxy so that repeated requests
+        through the same proxy reuse open connections instead of doing a new
+        TCP and TLS handshake every time
+
+        :param pool_size: max number of open connections kept per host,
+        normally the number of threads
+        :param headers: default headers sent with every request
+        :param proxy_pool: the pool to which the outcome of every proxied 
+        request is reported
+        :param rate_limiter: the limiter every request waits on
+        :param metrics: where the responses and bytes received are counted
+        """
+        self.pool_size = pool_size
+        self.headers = headers or {}
+        self.proxy_pool = proxy_pool
+        self.rate_limiter = rate_limiter
+        self.metrics = metrics
+
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def create_session(self, proxy:str) -> requests.Session:
+        """
+        Creates a session with a connection pool sized to the thread count
+
+        :param proxy: ip:port of the proxy the session goes through
+        """
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.pool_size,
+                              pool_maxsize=self.pool_size)
+
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.headers.update(self.headers)
+
+        return session
+
+    @staticmethod
+    def proxy_urls(proxy:str) -> dict:
+        """
+        Returns the proxies argument of a request through a given proxy. It
+        is passed with every request because proxies set on the session lose
+        to HTTP(S)_PROXY in the environment
+
+        :param proxy: ip:port of the proxy. None for direct connections
+        """
+        if not proxy:
+            return None
+
+        return {"http":f"http://{proxy}", "https":f"http://{proxy}"}
+
+    def get_session(self, proxy:str=None) -> requests.Session:
+        """
+        Returns the session for a given proxy, creating it if needed
+
+        :param proxy: ip:port of the proxy. None for direct connections
+        """
+        with self.lock:
+            if proxy not in self.sessions:
+                self.sessions[proxy] = self.create_session(proxy)
+
+            return self.sessions[proxy]
+
+    def get(self, url:str, proxy:str=None, rate_limited:bool=True,
+            **kwargs) -> requests.Response:
+        """
+        Sends a GET request through the pooled session of a given proxy
+
+        :param url: the url to fetch
+        :param proxy: ip:port of the proxy. None for direct connections
+        :param rate_limited: whether the request waits on the rate limiter
+        """
+        rate_limiter = self.rate_limiter if rate_limited else None
+
+        if rate_limiter is not None:
+            rate_limiter.wait(url)
+
+        trusted = self.is_trusted(proxy)
+        started = time.monotonic()
+
+        try:
+            response = self.get_session(proxy).get(
+                url, proxies=self.proxy_urls(proxy), **kwargs)
+
+        except:
+            self.report(proxy, False, started)
+            raise
+
+        self.report(proxy, response.status_code not in PROXY_ERRORS, started)
+
+        if self.metrics is not None:
+            self.metrics.inc("responses_total", status=response.status_code)
+            self.metrics.inc("bytes_received_total", len(response.content))
+
+        if rate_limiter is not None:
+            rate_limiter.feedback(url, response.status_code, response.headers,
+                                  trusted)
+
+        return response
+
+    def is_trusted(self, proxy:str) -> bool:
+        """
+        Tells whether a throttling response through a proxy can be blamed on
+        the site: always for direct connections, otherwise only for proxies
+        that are known to work
+
+        :param proxy: ip:port of the proxy. None for direct connections
+        """
+        return (not proxy or self.proxy_pool is None 
+                or self.proxy_pool.is_healthy(proxy))
+
+    def report(self, proxy:str, success:bool, started:float) -> None:
+        """
+        Reports the outcome of a proxied request to the proxy pool
+
+        :param proxy: ip:port of the proxy
+        :param success: whether the proxy returned a usable response
+        :param started: the monotonic time the request was sent
+        """
+        if proxy and self.proxy_pool is not None:
+            self.proxy_pool.report(
+                proxy, success, time.monotonic() - started)
+
+    def discard(self, proxy:str) -> None:
+        """
+        Closes and drops the session of a proxy that is no longer used
+
+        :param proxy: ip:port of the proxy
+        """
+        with self.lock:
+            session = self.sessions.pop(proxy, None)
+
+        if session is not None:
+            session.close()
+
+    def close(self) -> None:
+        """Closes all the pooled sessions"""
+        with self.lock:
+            sessions = list(self.sessions.values())
+            self.sessions.clear()
+
+        for session in sessions:
+            session.close()